@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+from rest_framework.permissions import SAFE_METHODS
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS, thread_name_prefix='async-read')
+
+
+def run_read_view(view, request, *args, **kwargs):
+    '''
+    Синхронная вьюха в потоке пула со своим соединением с бд.
+    Ответ рендерится здесь же, чтобы обработчик не ждал общий поток.
+    '''
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if isinstance(response, SimpleTemplateResponse):
+            response.render()
+            response = HttpResponse(
+                response.content, status=response.status_code,
+                headers=response.headers)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    '''
+    Асинхронная обёртка для ASGI: чтение выполняется параллельно
+    в пуле потоков, запись - как обычная синхронная вьюха Django.
+    '''
+    read = sync_to_async(
+        partial(run_read_view, view), thread_sensitive=False,
+        executor=executor)
+    write = sync_to_async(view, thread_sensitive=True)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    update_wrapper(async_view, view)
+    return async_view
+
+
+class AsyncReadMixin:
+    '''Асинхронное чтение вьюсета, если включено ASYNC_READ_VIEWS.'''
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if settings.ASYNC_READ_VIEWS:
+            return async_read_view(view)
+        return view
@@ -0,0 +1,65 @@
+from hashlib import sha256
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from .constants import (AUTH_TOKEN_CACHE_PREFIX, AUTH_TOKEN_CACHE_TIMEOUT,
+                        AUTH_USER_PRIVATE_FIELDS)
+
+
+def auth_token_cache_key(key):
+    '''Ключ кэша по хэшу токена, сам токен в кэш не попадает.'''
+    digest = sha256(key.encode()).hexdigest()
+    return f'{AUTH_TOKEN_CACHE_PREFIX}:{digest}'
+
+
+def forget_auth_tokens(keys):
+    cache.delete_many([auth_token_cache_key(key) for key in keys])
+
+
+def dump_fields(instance, exclude=()):
+    '''Значения полей модели по attname.'''
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname not in exclude
+    }
+
+
+def load_fields(model, values):
+    '''Экземпляр из сохранённых полей, остальные поля отложены.'''
+    names = [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Токен-аутентификация без запроса к бд на повторных запросах.
+    В кэше AUTH_TOKEN_CACHE_TIMEOUT секунд лежат поля токена без ключа
+    и поля пользователя без хэша пароля, пароль загружается из бд только
+    при обращении к нему. Запись удаляется при удалении токена
+    и сохранении пользователя, поэтому отключать пользователя нужно
+    через save(): после QuerySet.update() без post_save он останется
+    авторизован до истечения AUTH_TOKEN_CACHE_TIMEOUT.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache_key = auth_token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            token_fields, user_fields = cached
+            token = load_fields(self.get_model(), {**token_fields, 'key': key})
+            token.user = load_fields(
+                token._meta.get_field('user').related_model, user_fields)
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, (
+            dump_fields(token, exclude=('key',)),
+            dump_fields(user, exclude=AUTH_USER_PRIVATE_FIELDS),
+        ), AUTH_TOKEN_CACHE_TIMEOUT)
+        return user, token
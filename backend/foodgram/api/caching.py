@@ -0,0 +1,239 @@
+import time
+from hashlib import sha256
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from users.models import Follow
+
+from .constants import (CATALOG_CACHE_PREFIX, CATALOG_VERSION_PREFIX,
+                        PAGINATION_MODE_PARAM, RECIPE_FRAGMENT_PREFIX,
+                        RECIPE_FRAGMENTS_VERSION_KEY, RECIPE_LIST_CACHE_PREFIX,
+                        RECIPE_LIST_STATS_PREFIX, RECIPE_VERSION_PREFIX)
+
+CACHE_LOOKUP_RESULTS = ('hits', 'misses')
+
+
+def catalog_version_key(model):
+    return f'{CATALOG_VERSION_PREFIX}:{model._meta.label_lower}'
+
+
+def get_catalog_version(model):
+    '''Текущая версия справочника (время последнего изменения).'''
+    key = catalog_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), None)
+        version = cache.get(key, time.time())
+    return version
+
+
+def bump_catalog_version(model):
+    '''Новая версия справочника: старые записи кэша больше не читаются.'''
+    cache.set(catalog_version_key(model), time.time(), None)
+
+
+def recipe_version_key(recipe_id):
+    return f'{RECIPE_VERSION_PREFIX}:{recipe_id}'
+
+
+def get_versions(keys):
+    '''Версии по списку ключей за один запрос к кэшу.'''
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    now = time.time()
+    if missing:
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return {key: versions.get(key, now) for key in keys}
+
+
+def bump_recipe_versions(recipe_ids):
+    '''Новые версии фрагментов отдельных рецептов.'''
+    now = time.time()
+    cache.set_many(
+        {recipe_version_key(recipe_id): now for recipe_id in recipe_ids},
+        None)
+
+
+def bump_recipe_fragments():
+    '''Новая версия всех фрагментов: изменились теги, ингредиенты, авторы.'''
+    cache.set(RECIPE_FRAGMENTS_VERSION_KEY, time.time(), None)
+
+
+class CachedCatalogMixin:
+    '''
+    Кэширование списка справочника и условные GET-запросы.
+    Ключ кэша содержит версию справочника, которая меняется при записи.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        version = get_catalog_version(model)
+        query = sha256(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f'{model._meta.model_name}-{version}-{query[:16]}')
+        # Только ETag: Last-Modified с точностью до секунды
+        # дал бы 304 после записи в ту же секунду.
+        headers = {'ETag': etag}
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        cache_key = (
+            f'{CATALOG_CACHE_PREFIX}:{model._meta.label_lower}:'
+            f'{version}:{query}')
+        data = cache.get(cache_key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(cache_key, data)
+        return Response(data, headers=headers)
+
+
+def count_cache_lookup(result):
+    '''Счётчик попаданий или промахов кэша списка рецептов.'''
+    key = f'{RECIPE_LIST_STATS_PREFIX}:{result}'
+    if cache.add(key, 1, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_recipe_list_cache_stats():
+    '''Попадания и промахи кэша списка рецептов.'''
+    keys = {
+        f'{RECIPE_LIST_STATS_PREFIX}:{result}': result
+        for result in CACHE_LOOKUP_RESULTS
+    }
+    values = cache.get_many(keys)
+    return {result: values.get(key, 0) for key, result in keys.items()}
+
+
+class AnonymousListCacheMixin:
+    '''
+    Кэширование ответа списка для анонимных запросов.
+    Ключ содержит версию каталога рецептов и нормализованные параметры
+    фильтров и пагинации; с другими параметрами кэш не используется.
+    '''
+
+    def get_cached_params(self):
+        paginator = self.paginator
+        return {
+            *self.filterset_class.base_filters,
+            paginator.page_query_param,
+            paginator.page_size_query_param,
+            CursorPagination.cursor_query_param,
+            PAGINATION_MODE_PARAM,
+        }
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if (request.user.is_authenticated
+                or not params.keys() <= self.get_cached_params()):
+            return super().list(request, *args, **kwargs)
+        query = urlencode(sorted(
+            (name, value)
+            for name in params for value in params.getlist(name)
+        ))
+        url = request.build_absolute_uri(request.path)
+        cache_key = (
+            f'{RECIPE_LIST_CACHE_PREFIX}:'
+            f'{get_catalog_version(self.queryset.model)}:'
+            f'{sha256(f"{url}?{query}".encode()).hexdigest()}')
+        data = cache.get(cache_key)
+        if data is not None:
+            count_cache_lookup('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+        count_cache_lookup('misses')
+        response = super().list(request, *args, **kwargs)
+        cache.set(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class RecipeFragmentCacheMixin:
+    '''
+    Сборка списка рецептов из закэшированных фрагментов.
+    Фрагмент - ответ сериализатора без полей текущего пользователя,
+    они накладываются поверх по флагам из запроса страницы.
+    '''
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.get_queryset()).prefetch_related(None).only('id', 'author')
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        fragments = self.get_fragments([recipe.id for recipe in recipes])
+        subscribed = self.get_subscribed_authors(
+            {recipe.author_id for recipe in recipes})
+        data = []
+        for recipe in recipes:
+            fragment = fragments.get(recipe.id)
+            if fragment is None:
+                continue
+            data.append({
+                **fragment,
+                'author': {
+                    **fragment['author'],
+                    'is_subscribed': recipe.author_id in subscribed,
+                },
+                'is_favorited': recipe.is_favorited,
+                'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            })
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def get_subscribed_authors(self, author_ids):
+        '''Авторы страницы, на которых подписан пользователь.'''
+        user = self.request.user
+        if not user.is_authenticated or not author_ids:
+            return set()
+        return set(Follow.objects.filter(
+            user=user, author__in=author_ids
+        ).values_list('author_id', flat=True))
+
+    def get_fragments(self, recipe_ids):
+        '''Фрагменты рецептов из кэша, недостающие сериализуются.'''
+        host = sha256(
+            self.request.build_absolute_uri('/').encode()).hexdigest()[:16]
+        versions = get_versions(
+            [RECIPE_FRAGMENTS_VERSION_KEY] + [
+                recipe_version_key(recipe_id) for recipe_id in recipe_ids])
+        shared_version = versions[RECIPE_FRAGMENTS_VERSION_KEY]
+        keys = {
+            recipe_id: (
+                f'{RECIPE_FRAGMENT_PREFIX}:{host}:{shared_version}:'
+                f'{recipe_id}:{versions[recipe_version_key(recipe_id)]}')
+            for recipe_id in recipe_ids
+        }
+        cached = cache.get_many(keys.values())
+        fragments = {
+            recipe_id: cached[key]
+            for recipe_id, key in keys.items() if key in cached
+        }
+        missing = [
+            recipe_id for recipe_id in recipe_ids
+            if recipe_id not in fragments
+        ]
+        if missing:
+            serializer = self.get_serializer(
+                self.get_queryset().filter(id__in=missing), many=True)
+            fresh = {}
+            for item in serializer.data:
+                fresh[item['id']] = {
+                    **item,
+                    'is_favorited': False,
+                    'is_in_shopping_cart': False,
+                    'author': {**item['author'], 'is_subscribed': False},
+                }
+            cache.set_many({
+                keys[recipe_id]: fragment
+                for recipe_id, fragment in fresh.items()
+            })
+            fragments.update(fresh)
+        return fragments
@@ -1,6 +1,58 @@
-# api/views
+# api/shopping_list
+FONT_NAME = 'DejaVuSans'
+FONT_PATH = 'font/DejaVuSans.ttf'
+FONT_SIZE = 14
 LEFT_INDENT = 50
-
 HEIGHT_OFFSET = 800
+BOTTOM_OFFSET = 50
+LINE_HEIGHT = 25
+SHOPPING_LIST_FILENAME = 'shopping_cart'
+SHOPPING_LIST_CACHE_PREFIX = 'shopping_list'
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+# api/views
+SHOPPING_LIST_FORMAT_PARAM = 'file_format'
+DEFAULT_SHOPPING_LIST_FORMAT = 'pdf'
+RECIPE_BATCH_MAX_SIZE = 100
+BATCH_ADDED = 'added'
+BATCH_ALREADY_PRESENT = 'already_present'
+BATCH_REMOVED = 'removed'
+BATCH_NOT_PRESENT = 'not_present'
+BATCH_NOT_FOUND = 'not_found'
+# api/caching
+CATALOG_VERSION_PREFIX = 'catalog_version'
+CATALOG_CACHE_PREFIX = 'catalog'
+RECIPE_LIST_CACHE_PREFIX = 'recipe_list'
+RECIPE_LIST_STATS_PREFIX = 'recipe_list_stats'
+RECIPE_FRAGMENT_PREFIX = 'recipe_fragment'
+RECIPE_VERSION_PREFIX = 'recipe_version'
+RECIPE_FRAGMENTS_VERSION_KEY = 'recipe_fragments_version'
+# api/filters
+INGREDIENTS_SEARCH_LIMIT = 20
+INGREDIENTS_MAX_LIMIT = 100
+INGREDIENTS_SUBSTRING_MIN_LENGTH = 3
+# Совпадает с конфигурацией триггера в миграции recipes 0021.
+RECIPE_SEARCH_CONFIG = 'russian'
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+TAGS_MATCH_CHOICES = (
+    (TAGS_MATCH_ANY, 'Любой из тегов'),
+    (TAGS_MATCH_ALL, 'Все теги'),
+)
 # api/pagination
 PAGE_SIZE = 10
+PAGINATION_MODE_PARAM = 'paginate'
+CURSOR_PAGINATION_MODE = 'cursor'
+# api/authentication
+AUTH_TOKEN_CACHE_PREFIX = 'auth_token'
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_USER_PRIVATE_FIELDS = ('password',)
+# api/replicas
+REPLICA_STICKY_PREFIX = 'replica_sticky'
+# api/metrics
+METRICS_PREFIX = 'foodgram'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
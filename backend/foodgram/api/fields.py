@@ -0,0 +1,32 @@
+from pathlib import PurePosixPath
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    '''Ссылки на миниатюры изображения рецепта.'''
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for size, name in value.items():
+            url = default_storage.url(name)
+            urls[size] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class UploadedImageField(Base64ImageField):
+    '''
+    Картинка строкой base64 или файлом из multipart-формы.
+    Файл из формы уже лежит на диске и не декодируется в памяти.
+    '''
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            suffix = PurePosixPath(data.name or '').suffix.lower()
+            data.name = self.get_file_name(data) + suffix
+            return serializers.ImageField.to_internal_value(self, data)
+        return super().to_internal_value(data)
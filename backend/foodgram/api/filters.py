@@ -1,10 +1,51 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Value, When)
 from django_filters import rest_framework as filters
 from recipes.models import CustomUser, Recipe, Tag
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend, SearchFilter
 
+from .constants import (INGREDIENTS_MAX_LIMIT, INGREDIENTS_SEARCH_LIMIT,
+                        INGREDIENTS_SUBSTRING_MIN_LENGTH, RECIPE_SEARCH_CONFIG,
+                        TAGS_MATCH_ALL, TAGS_MATCH_CHOICES)
 
-class IngredientsFilter(SearchFilter):
+
+class IngredientsFilter(BaseFilterBackend):
+    '''
+    Поиск ингредиентов для автодополнения.
+    Сначала идут совпадения по началу названия, затем по подстроке.
+    '''
     search_param = 'name'
+    limit_param = 'limit'
+
+    def get_limit(self, request, default):
+        try:
+            limit = int(request.query_params[self.limit_param])
+        except (KeyError, ValueError):
+            return default
+        if limit < 1:
+            return default
+        return min(limit, INGREDIENTS_MAX_LIMIT)
+
+    def filter_queryset(self, request, queryset, view):
+        # get_object() тоже фильтрует queryset, срез ему не подходит.
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name:
+            limit = self.get_limit(request, None)
+            return queryset[:limit] if limit else queryset
+        limit = self.get_limit(request, INGREDIENTS_SEARCH_LIMIT)
+        if len(name) < INGREDIENTS_SUBSTRING_MIN_LENGTH:
+            return queryset.filter(
+                name__istartswith=name).order_by('name')[:limit]
+        return queryset.filter(name__icontains=name).annotate(
+            prefix_rank=Case(
+                When(name__istartswith=name, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField())
+        ).order_by('prefix_rank', 'name')[:limit]
 
 
 class RecipesFilter(filters.FilterSet):
@@ -18,25 +59,67 @@ class RecipesFilter(filters.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags'
     )
+    tags_match = filters.ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES, method='filter_tags_match')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = [
-            'tags', 'author', 'is_favorited', 'is_in_shopping_cart'
+            'tags', 'tags_match', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'search'
         ]
 
+    def filter_tags(self, queryset, name, value):
+        '''
+        Рецепты с любым из тегов или, при tags_match=all, со всеми.
+        Подзапросы EXISTS не размножают строки рецептов, в отличие
+        от соединения с таблицей тегов.
+        '''
+        if not value:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_match') != TAGS_MATCH_ALL:
+            return queryset.filter(Exists(recipe_tags.filter(tag__in=value)))
+        for tag in value:
+            queryset = queryset.filter(Exists(recipe_tags.filter(tag=tag)))
+        return queryset
+
+    def filter_tags_match(self, queryset, name, value):
+        '''Режим применяется в filter_tags.'''
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        '''
+        Полнотекстовый поиск по названию и тексту с сортировкой
+        по релевантности. Без PostgreSQL ищется подстрока.
+        '''
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value))
+        query = SearchQuery(
+            value, config=RECIPE_SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-id')
+
 
 class IngredientFilter(SearchFilter):
     '''Фильтры для ингредиентов.'''
@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.serializers import ListSerializer
+
+from .caching import get_recipe_list_cache_stats
+from .constants import (DURATION_BUCKETS, METRICS_PREFIX, QUERY_COUNT_BUCKETS,
+                        SIZE_BUCKETS)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    '''Показатели одного запроса.'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0
+        self.serializer_time = 0
+        self.serializing = False
+
+
+class Histogram:
+    '''Гистограмма в памяти процесса с подписью view.'''
+
+    def __init__(self, name, description, buckets):
+        self.name = f'{METRICS_PREFIX}_{name}'
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, value):
+        with self.lock:
+            counts, total, count = self.series.get(
+                view, ([0] * len(self.buckets), 0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.series[view] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(
+                (view, list(counts), total, count)
+                for view, (counts, total, count) in self.series.items())
+        for view, counts, total, count in series:
+            label = f'view="{escape_label(view)}"'
+            for bound, value in zip(self.buckets, counts):
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {value}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+HISTOGRAMS = {
+    'duration': Histogram(
+        'request_duration_seconds', 'Время обработки запроса.',
+        DURATION_BUCKETS),
+    'queries': Histogram(
+        'request_sql_queries', 'Количество SQL-запросов.',
+        QUERY_COUNT_BUCKETS),
+    'sql_time': Histogram(
+        'request_sql_duration_seconds', 'Время SQL-запросов.',
+        DURATION_BUCKETS),
+    'serializer_time': Histogram(
+        'request_serializer_duration_seconds', 'Время сериализации.',
+        DURATION_BUCKETS),
+    'size': Histogram(
+        'response_size_bytes', 'Размер ответа.', SIZE_BUCKETS),
+}
+
+
+def escape_label(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+
+
+def view_name(request):
+    '''Вьюсет и действие, например RecipeViewSet.download_shopping_cart.'''
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match._func_path
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length', 0))
+    return len(response.content)
+
+
+def record(request, response, metrics):
+    view = view_name(request)
+    HISTOGRAMS['duration'].observe(
+        view, time.perf_counter() - metrics.started)
+    HISTOGRAMS['queries'].observe(view, metrics.queries)
+    HISTOGRAMS['sql_time'].observe(view, metrics.sql_time)
+    HISTOGRAMS['serializer_time'].observe(view, metrics.serializer_time)
+    HISTOGRAMS['size'].observe(view, response_size(response))
+
+
+def render_metrics():
+    '''Все показатели в текстовом формате Prometheus.'''
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    for result, value in get_recipe_list_cache_stats().items():
+        name = f'{METRICS_PREFIX}_recipe_list_cache_{result}_total'
+        lines.extend((
+            f'# HELP {name} Кэш списка рецептов для анонимов.',
+            f'# TYPE {name} counter',
+            f'{name} {value}',
+        ))
+    return '\n'.join(lines) + '\n'
+
+
+def time_query(execute, sql, params, many, context):
+    '''Подсчёт SQL-запросов текущего запроса.'''
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@contextmanager
+def serializer_timer():
+    '''Время внешнего сериализатора, вложенные не считаются отдельно.'''
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    '''
+    Замер времени сериализации ответа для PERFORMANCE_METRICS.
+    Для many=True в Meta указывается list_serializer_class
+    = TimedListSerializer.
+    '''
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    '''Список с замером времени сериализации.'''
+
+
+def install():
+    '''Подключение счётчика SQL-запросов, один раз на процесс.'''
+    connection_created.connect(install_query_timer)
+    for connection in connections.all():
+        install_query_timer(connection)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    '''
+    Сбор показателей запросов при включённом PERFORMANCE_METRICS.
+    Выключенный middleware не попадает в цепочку обработки.
+    '''
+    if not settings.PERFORMANCE_METRICS:
+        raise MiddlewareNotUsed
+    install()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics()
+            token = current_metrics.set(metrics)
+            try:
+                response = await get_response(request)
+            finally:
+                current_metrics.reset(token)
+            record(request, response, metrics)
+            return response
+    else:
+        def middleware(request):
+            metrics = RequestMetrics()
+            token = current_metrics.set(metrics)
+            try:
+                response = get_response(request)
+            finally:
+                current_metrics.reset(token)
+            record(request, response, metrics)
+            return response
+
+    return middleware
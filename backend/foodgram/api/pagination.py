@@ -1,9 +1,37 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
-from .constants import PAGE_SIZE
+from .constants import CURSOR_PAGINATION_MODE, PAGE_SIZE, PAGINATION_MODE_PARAM
+
+
+class CursorApiPagination(CursorPagination):
+    '''Пагинация по курсору без COUNT и OFFSET.'''
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    ordering = '-id'
 
 
 class CustomApiPagination(PageNumberPagination):
-    '''Кастомная пагинация.'''
+    '''
+    Кастомная пагинация.
+    По умолчанию постраничная, с ?paginate=cursor переключается на курсор.
+    Курсор сортирует по id, поэтому queryset со своей сортировкой
+    (поиск по релевантности) остаётся постраничным.
+    '''
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = tuple(queryset.query.order_by)
+        if (request.query_params.get(PAGINATION_MODE_PARAM)
+                == CURSOR_PAGINATION_MODE
+                and ordering in ((), (CursorApiPagination.ordering,))):
+            self.cursor_paginator = CursorApiPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,98 @@
+import asyncio
+import random
+from contextvars import ContextVar
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+from .constants import REPLICA_STICKY_PREFIX
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def sticky_key(request):
+    '''Ключ недавней записи по заголовку авторизации, у анонимов нет.'''
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    digest = sha256(authorization.encode()).hexdigest()
+    return f'{REPLICA_STICKY_PREFIX}:{digest}'
+
+
+def can_read_from_replica(request):
+    '''Безопасный запрос от пользователя без недавних записей.'''
+    if request.method not in SAFE_METHODS:
+        return False
+    key = sticky_key(request)
+    return key is None or cache.get(key) is None
+
+
+def remember_write(request):
+    '''Чтение с основной бд на время REPLICA_READ_AFTER_WRITE.'''
+    if request.method in SAFE_METHODS:
+        return
+    key = sticky_key(request)
+    if key is not None:
+        cache.set(key, True, settings.REPLICA_READ_AFTER_WRITE)
+
+
+class ReplicaRouter:
+    '''
+    Чтение безопасных запросов с реплик, запись и чтение внутри
+    transaction.atomic с основной бд. Токены всегда читаются
+    с основной бд, чтобы вход и выход действовали сразу.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if not settings.REPLICA_DATABASES or not read_from_replica.get():
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'authtoken':
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    '''
+    Выбор бд для чтения на время запроса.
+    Без настроенных реплик middleware не попадает в цепочку обработки.
+    '''
+    if not settings.REPLICA_DATABASES:
+        raise MiddlewareNotUsed
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = read_from_replica.set(can_read_from_replica(request))
+            try:
+                response = await get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            remember_write(request)
+            return response
+    else:
+        def middleware(request):
+            token = read_from_replica.set(can_read_from_replica(request))
+            try:
+                response = get_response(request)
+            finally:
+                read_from_replica.reset(token)
+            remember_write(request)
+            return response
+
+    return middleware
@@ -1,52 +1,70 @@
+import json
+
 from django.db import transaction
-from django.db.models import F
-from django.forms import ValidationError
-from drf_extra_fields.fields import Base64ImageField
+from django.db.models import F, prefetch_related_objects
+from recipes.images import schedule_image_processing
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from users.models import CustomUser
 from users.serializers import UserSerializer
 
+from .constants import RECIPE_BATCH_MAX_SIZE
+from .fields import ThumbnailsField, UploadedImageField
+from .metrics import TimedListSerializer, TimedSerializerMixin
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для тегов.'''
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для ингредиентов.'''
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
+        list_serializer_class = TimedListSerializer
+
+
+class RecipeIngredientSerializer(serializers.ModelSerializer):
+    '''Сериализатор для ингредиентов в рецепте.'''
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для безопасных запросов рецепта.'''
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author',
                   'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name', 'image',
-                  'text', 'cooking_time')
-
-    def get_ingredients(self, obj):
-        '''Получение поля ингредиентов.'''
-        ingredients = obj.ingredients.values(
-            'id', 'name', 'measurement_unit', amount=F(
-                'recipe_ingredients__amount')
-        )
-        return ingredients
+                  'thumbnails', 'text', 'cooking_time')
+        list_serializer_class = TimedListSerializer
 
     def get_is_favorited(self, obj):
         '''Получение поля избранного.'''
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (
             user.is_authenticated and Favorite.objects.filter(
@@ -54,32 +72,32 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         '''Получение поля списка покупок.'''
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             user.is_authenticated and ShoppingCart.objects.filter(
                 user=user, recipe=obj).exists())
 
 
-class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
+class RecipeCreateUpdateSerializer(TimedSerializerMixin,
+                                   serializers.ModelSerializer):
     '''Serializer для небезопасных запросов рецепта.'''
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True)
+    image = UploadedImageField()
+    thumbnails = ThumbnailsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
-
-    def get_ingredients(self, obj):
-        '''Получение поля ингредиентов.'''
-        ingredients = obj.ingredients.values(
-            'id', 'name', 'measurement_unit', amount=F(
-                'recipe_ingredients__amount')
-        )
-        return ingredients
+        fields = ('id', 'tags', 'author',
+                  'ingredients',
+                  'is_favorited', 'is_in_shopping_cart', 'name', 'image',
+                  'thumbnails', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
         '''Получение поля избранного.'''
@@ -94,44 +112,131 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         '''Валидация данных для рецепта.'''
-        tags_ids = self.initial_data.get('tags')
-        ingredients = self.initial_data.get('ingredients')
+        tags_ids = self.get_initial_list('tags')
+        ingredients = self.get_initial_list('ingredients')
         if not tags_ids or not ingredients:
             raise ValidationError('Мало данных.')
+        data['tags'] = self.validate_tags_ids(tags_ids)
+        data['ingredients'] = self.validate_ingredients_amounts(ingredients)
         return data
 
+    def get_initial_list(self, field):
+        '''
+        Список из json-тела или из полей multipart-формы.
+        В форме список передаётся повтором поля или одной json-строкой.
+        '''
+        if not hasattr(self.initial_data, 'getlist'):
+            return self.initial_data.get(field)
+        values = []
+        for value in self.initial_data.getlist(field):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            if isinstance(value, list):
+                values.extend(value)
+            else:
+                values.append(value)
+        return values
+
+    def validate_tags_ids(self, tags_ids):
+        '''Проверка тегов одним запросом.'''
+        try:
+            tags_ids = {int(tag_id) for tag_id in tags_ids}
+        except (TypeError, ValueError):
+            raise ValidationError({'tags': 'Некорректный id тега.'})
+        found = set(
+            Tag.objects.filter(id__in=tags_ids).values_list('id', flat=True))
+        if found != tags_ids:
+            raise ValidationError(
+                {'tags': f'Теги не найдены: {sorted(tags_ids - found)}.'})
+        return tags_ids
+
+    def validate_ingredients_amounts(self, ingredients):
+        '''Проверка ингредиентов одним запросом.'''
+        amounts = {}
+        try:
+            for ingredient in ingredients:
+                ingredient_id = int(ingredient['id'])
+                amount = int(ingredient['amount'])
+                if amount < 1:
+                    raise ValidationError(
+                        {'ingredients': 'Количество должно быть больше 0.'})
+                if ingredient_id in amounts:
+                    raise ValidationError(
+                        {'ingredients': 'Ингредиенты не должны повторяться.'})
+                amounts[ingredient_id] = amount
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                {'ingredients': 'Укажите id и количество ингредиента.'})
+        found = set(Ingredient.objects.filter(
+            id__in=amounts).values_list('id', flat=True))
+        missing = amounts.keys() - found
+        if missing:
+            raise ValidationError(
+                {'ingredients': f'Ингредиенты не найдены: {sorted(missing)}.'})
+        return amounts
+
     @transaction.atomic
     def create(self, validated_data):
         '''Создание рецепта.'''
-        ingredients = self.initial_data.pop('ingredients')
-        tags = self.initial_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for ingredient in ingredients:
-            ingredient_obj = Ingredient.objects.get(id=ingredient['id'])
-            RecipeIngredient.objects.update_or_create(
-                recipe=recipe,
-                ingredient=ingredient_obj,
-                amount=ingredient['amount'])
+        CustomUser.objects.filter(id=recipe.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in ingredients.items()
+        )
         recipe.tags.set(tags)
+        schedule_image_processing(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         '''Обновление рецепта.'''
-        ingredients = self.initial_data.pop('ingredients')
-        tags = self.initial_data.pop('tags')
-        instance.ingredients.clear()
-        for ingredient in ingredients:
-            ingredient_obj = Ingredient.objects.get(id=ingredient['id'])
-            RecipeIngredient.objects.update_or_create(
-                recipe=instance,
-                ingredient=ingredient_obj,
-                amount=ingredient['amount'])
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in instance.recipe_ingredients.all()
+        }
+        removed = current.keys() - ingredients.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=instance, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in ingredients.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=instance, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in ingredients.items()
+            if ingredient_id not in current
+        )
         instance.tags.set(tags)
-        return super().update(instance, validated_data)
+        if 'image' in validated_data:
+            instance.image_processed = False
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_image_processing(instance)
+        return instance
+
+    def to_representation(self, instance):
+        '''Ответ после записи без отдельного запроса на каждый ингредиент.'''
+        prefetch_related_objects(
+            [instance], 'recipe_ingredients__ingredient', 'tags')
+        return super().to_representation(instance)
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для избранного.'''
     id = serializers.PrimaryKeyRelatedField(source='recipe', read_only=True)
     name = serializers.ReadOnlyField(source='recipe.name', read_only=True)
@@ -144,7 +249,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'coocking_time')
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     '''Сериализатор для списка покупок.'''
     id = serializers.PrimaryKeyRelatedField(source='recipe', read_only=True)
     name = serializers.ReadOnlyField(source='recipe.name', read_only=True)
@@ -155,3 +261,13 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('id', 'name', 'image', 'coocking_time')
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    '''Список id рецептов для пакетного добавления и удаления.'''
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=RECIPE_BATCH_MAX_SIZE)
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
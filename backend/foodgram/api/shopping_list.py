@@ -0,0 +1,131 @@
+import csv
+from hashlib import sha256
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .constants import (BOTTOM_OFFSET, FONT_NAME, FONT_PATH, FONT_SIZE,
+                        HEIGHT_OFFSET, LEFT_INDENT, LINE_HEIGHT,
+                        SHOPPING_LIST_CACHE_PREFIX,
+                        SHOPPING_LIST_CACHE_TIMEOUT, SHOPPING_LIST_FILENAME)
+
+
+def register_fonts():
+    '''Однократная регистрация шрифтов при старте приложения.'''
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, settings.BASE_DIR / FONT_PATH))
+
+
+def format_ingredient(ingredient):
+    '''Строка списка покупок для одного ингредиента.'''
+    return (f'{ingredient["ingredient__name"]}: '
+            f'({ingredient["total_amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]})')
+
+
+class PDFPageLayout:
+    '''Постраничная раскладка строк, своя для каждого запроса.'''
+
+    def __init__(self, buffer):
+        self.pdf = canvas.Canvas(buffer)
+        self.height_offset = HEIGHT_OFFSET
+        self.pdf.setFont(FONT_NAME, size=FONT_SIZE)
+
+    def draw_line(self, text):
+        '''Вывод строки с переносом на новую страницу.'''
+        if self.height_offset < BOTTOM_OFFSET:
+            self.pdf.showPage()
+            self.pdf.setFont(FONT_NAME, size=FONT_SIZE)
+            self.height_offset = HEIGHT_OFFSET
+        self.pdf.drawString(LEFT_INDENT, self.height_offset, text)
+        self.height_offset -= LINE_HEIGHT
+
+    def save(self):
+        self.pdf.showPage()
+        self.pdf.save()
+
+
+def render_pdf(title, ingredients):
+    '''Список покупок в PDF.'''
+    buffer = BytesIO()
+    layout = PDFPageLayout(buffer)
+    layout.draw_line(title)
+    for ingredient in ingredients:
+        layout.draw_line(format_ingredient(ingredient))
+    layout.save()
+    return buffer.getvalue()
+
+
+def render_txt(title, ingredients):
+    '''Список покупок простым текстом.'''
+    lines = [title]
+    lines.extend(format_ingredient(ingredient) for ingredient in ingredients)
+    return '\n'.join(lines).encode() + b'\n'
+
+
+def render_csv(title, ingredients):
+    '''Список покупок в CSV.'''
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['total_amount'],
+            ingredient['ingredient__measurement_unit']))
+    return buffer.getvalue().encode()
+
+
+SHOPPING_LIST_FORMATS = {
+    'pdf': (render_pdf, 'application/pdf'),
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def shopping_list_etag(title, ingredients, file_format):
+    '''ETag, вычисленный по содержимому списка покупок.'''
+    digest = sha256(f'{file_format}\n{title}\n'.encode())
+    for ingredient in ingredients:
+        digest.update(f'{format_ingredient(ingredient)}\n'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def shopping_list_cache_key(user_id, file_format):
+    return f'{SHOPPING_LIST_CACHE_PREFIX}:{user_id}:{file_format}'
+
+
+def invalidate_shopping_list(user_id):
+    '''Сброс закэшированных списков покупок пользователя.'''
+    cache.delete_many([
+        shopping_list_cache_key(user_id, file_format)
+        for file_format in SHOPPING_LIST_FORMATS
+    ])
+
+
+def get_shopping_list(user_id, title, ingredients, file_format, etag):
+    '''Готовый файл из кэша или заново отрисованный.'''
+    cache_key = shopping_list_cache_key(user_id, file_format)
+    cached = cache.get(cache_key)
+    if cached is not None and cached[0] == etag:
+        return cached[1]
+    render, _ = SHOPPING_LIST_FORMATS[file_format]
+    content = render(title, ingredients)
+    cache.set(cache_key, (etag, content), SHOPPING_LIST_CACHE_TIMEOUT)
+    return content
+
+
+def shopping_list_response(content, file_format, etag):
+    '''Ответ со списком покупок в нужном формате.'''
+    _, content_type = SHOPPING_LIST_FORMATS[file_format]
+    filename = f'{SHOPPING_LIST_FILENAME}.{file_format}'
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = etag
+    return response
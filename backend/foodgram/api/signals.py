@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import image_processed
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser
+
+from .authentication import forget_auth_tokens
+from .caching import (bump_catalog_version, bump_recipe_fragments,
+                      bump_recipe_versions)
+
+# Поля пользователя, которые не попадают в ответ со списком рецептов.
+PRIVATE_USER_FIELDS = {'last_login', 'password'}
+
+
+def bump_recipe_catalog(recipe_ids=None):
+    '''
+    Новая версия каталога рецептов после фиксации транзакции.
+    Без recipe_ids сбрасываются фрагменты всех рецептов.
+    '''
+    def bump():
+        bump_catalog_version(Recipe)
+        if recipe_ids is None:
+            bump_recipe_fragments()
+        else:
+            bump_recipe_versions(recipe_ids)
+
+    transaction.on_commit(bump)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    '''
+    Новая версия кэша тегов или ингредиентов после фиксации транзакции,
+    иначе читатель успеет закэшировать старые строки под новой версией.
+    '''
+    transaction.on_commit(lambda: bump_catalog_version(sender))
+    bump_recipe_catalog()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    '''Новая версия кэша рецепта.'''
+    bump_recipe_catalog([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    '''Новая версия кэша рецепта при правке его ингредиентов.'''
+    bump_recipe_catalog([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    '''Новая версия кэша рецептов при смене их тегов.'''
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_recipe_catalog([instance.pk])
+    else:
+        bump_recipe_catalog(pk_set)
+
+
+@receiver(image_processed, sender=Recipe)
+def recipe_image_processed(sender, recipe_id, **kwargs):
+    '''Обновление через update() не шлёт post_save, сброс по сигналу.'''
+    bump_recipe_catalog([recipe_id])
+
+
+@receiver(post_save, sender=CustomUser)
+def author_changed(sender, created, update_fields=None, **kwargs):
+    '''Автор показывается в рецептах, его изменения сбрасывают кэш.'''
+    if created or (update_fields and update_fields <= PRIVATE_USER_FIELDS):
+        return
+    bump_recipe_catalog()
+
+
+@receiver(post_delete, sender=Token)
+def auth_token_deleted(sender, instance, **kwargs):
+    '''Выход из аккаунта действует сразу после фиксации.'''
+    # После удаления Django обнуляет первичный ключ, то есть сам токен.
+    keys = [instance.key]
+    transaction.on_commit(lambda: forget_auth_tokens(keys))
+
+
+@receiver(post_save, sender=CustomUser)
+def auth_user_changed(sender, instance, created, update_fields=None,
+                      **kwargs):
+    '''Смена пароля и данных пользователя сбрасывает его токены в кэше.'''
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    transaction.on_commit(lambda: forget_auth_tokens(keys))
@@ -0,0 +1,350 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from unittest import skipIf
+
+from api.authentication import auth_token_cache_key
+from api.metrics import HISTOGRAMS
+from api.pagination import CustomApiPagination
+from api.replicas import replica_middleware
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+from users.models import CustomUser, Follow
+
+RECIPES_URL = '/api/recipes/'
+
+base_serializer_data = BaseSerializer.data
+
+
+class RecipeListQueriesTest(TestCase):
+    '''Количество запросов списка рецептов не зависит от размера страницы.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            CustomUser.objects.create(
+                email=f'author{index}@example.com',
+                username=f'author{index}',
+                first_name='Автор', last_name='Автор')
+            for index in range(2)
+        ]
+        cls.user = CustomUser.objects.create(
+            email='user@example.com', username='user',
+            first_name='Пользователь', last_name='Пользователь')
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', color=color,
+                               slug=f'tag-{index}')
+            for index, color in enumerate(('#0000FF', '#FF6600'))
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(5)
+        ]
+        for index in range(30):
+            recipe = Recipe.objects.create(
+                author=authors[index % 2], name=f'Рецепт {index}',
+                text='Текст', image='images/recipe.jpg', cooking_time=10)
+            recipe.tags.set(tags[:index % 2 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+                for ingredient in ingredients[:3]
+            )
+            if index % 3 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 4 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(self.user)
+
+    def assert_list_queries(self, client, expected):
+        for limit in (5, 25):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = client.get(RECIPES_URL, {'limit': limit})
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list(self):
+        self.assert_list_queries(APIClient(), 7)
+
+    def test_authenticated_list(self):
+        self.assert_list_queries(self.auth_client, 8)
+
+    def test_authenticated_flags(self):
+        response = self.auth_client.get(RECIPES_URL, {'limit': 30})
+        results = response.data['results']
+        for flag, model in (('is_favorited', Favorite),
+                            ('is_in_shopping_cart', ShoppingCart)):
+            with self.subTest(flag=flag):
+                self.assertEqual(
+                    {recipe['id'] for recipe in results if recipe[flag]},
+                    set(model.objects.filter(user=self.user).values_list(
+                        'recipe_id', flat=True)))
+
+
+@skipIf(connection.vendor == 'sqlite',
+        'SQLite блокирует таблицу целиком при параллельной записи')
+class ConcurrentAddTest(TransactionTestCase):
+    '''Одновременные добавления одного рецепта создают одну строку.'''
+    threads = 6
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(
+            email='user@example.com', username='user',
+            first_name='Пользователь', last_name='Пользователь')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст',
+            image='images/recipe.jpg', cooking_time=10)
+
+    def post_concurrently(self, url):
+        barrier = Barrier(self.threads)
+
+        def post(_):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return client.post(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return sorted(pool.map(post, range(self.threads)))
+
+    def assert_single_row(self, action, model, counter):
+        statuses = self.post_concurrently(
+            f'{RECIPES_URL}{self.recipe.id}/{action}/')
+        self.assertEqual(statuses, [201] + [400] * (self.threads - 1))
+        self.assertEqual(model.objects.filter(
+            user=self.user, recipe=self.recipe).count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), 1)
+
+    def test_favorite(self):
+        self.assert_single_row('favorite', Favorite, 'favorites_count')
+
+    def test_shopping_cart(self):
+        self.assert_single_row(
+            'shopping_cart', ShoppingCart, 'in_carts_count')
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    '''Токен из кэша: без запроса на повторных запросах и сброс сразу.'''
+    me_url = '/api/users/me/'
+    password = 'old-password-123'
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(
+            email='user@example.com', username='user',
+            first_name='Пользователь', last_name='Пользователь')
+        self.user.set_password(self.password)
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_warm_request_skips_token_query(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.me_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.me_url)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_cache_has_no_password_hash(self):
+        self.client.get(self.me_url)
+        cached = cache.get(auth_token_cache_key(self.token.key))
+        self.assertIsNotNone(cached)
+        self.assertNotIn(self.user.password, repr(cached))
+
+    def test_cache_has_no_token_key(self):
+        self.client.get(self.me_url)
+        cached = cache.get(auth_token_cache_key(self.token.key))
+        self.assertNotIn(self.token.key, repr(cached))
+        response = self.client.get(self.me_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.renderer_context['request'].auth.key, self.token.key)
+
+    def test_deactivation_revokes_immediately(self):
+        self.client.get(self.me_url)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(self.me_url).status_code, 401)
+
+    def test_logout_revokes_immediately(self):
+        self.client.get(self.me_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.me_url).status_code, 401)
+
+    def test_set_password_with_cached_user(self):
+        self.client.get(self.me_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/users/set_password/', {
+                    'current_password': self.password,
+                    'new_password': 'new-password-456',
+                }, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(auth_token_cache_key(self.token.key)))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password-456'))
+        with self.assertNumQueries(2):
+            self.client.get(self.me_url)
+
+
+class CatalogConditionalGetTest(TestCase):
+    '''Условные запросы справочника проверяются только по ETag.'''
+    tags_url = '/api/tags/'
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Завтрак', color='#0000FF', slug='breakfast')
+
+    def test_not_modified_by_etag(self):
+        etag = self.client.get(self.tags_url)['ETag']
+        response = self.client.get(self.tags_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_write_in_same_second_is_not_hidden(self):
+        response = self.client.get(self.tags_url)
+        self.assertNotIn('Last-Modified', response)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', color='#FF6600', slug='lunch')
+        response = self.client.get(
+            self.tags_url, HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class CursorPaginationOrderingTest(TestCase):
+    '''Курсор не перезаписывает сортировку поиска по релевантности.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Автор')
+        for name in ('Борщ', 'Арбузный борщ', 'Вареники'):
+            Recipe.objects.create(
+                author=author, name=name, text='Текст',
+                image='images/recipe.jpg', cooking_time=10)
+
+    def paginate(self, queryset):
+        request = Request(RequestFactory().get(
+            RECIPES_URL, {'paginate': 'cursor'}))
+        paginator = CustomApiPagination()
+        page = paginator.paginate_queryset(queryset, request)
+        return paginator, [recipe.name for recipe in page]
+
+    def test_default_ordering_uses_cursor(self):
+        paginator, _ = self.paginate(Recipe.objects.all())
+        self.assertIsNotNone(paginator.cursor_paginator)
+
+    def test_custom_ordering_is_kept(self):
+        paginator, names = self.paginate(
+            Recipe.objects.order_by('name', '-id'))
+        self.assertIsNone(paginator.cursor_paginator)
+        self.assertEqual(names, ['Арбузный борщ', 'Борщ', 'Вареники'])
+
+    def test_search_with_cursor(self):
+        response = self.client.get(
+            RECIPES_URL, {'search': 'орщ', 'paginate': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+@override_settings(PERFORMANCE_METRICS=True)
+class SerializerMetricsTest(TestCase):
+    '''Время сериализации считается без подмены классов DRF.'''
+
+    def test_serializer_time_recorded(self):
+        Tag.objects.create(name='Завтрак', color='#0000FF', slug='breakfast')
+        histogram = HISTOGRAMS['serializer_time']
+        view = 'TagViewSet.list'
+        before = histogram.series.get(view, (None, 0, 0))
+        cache.clear()
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        _, total, count = histogram.series[view]
+        self.assertEqual(count, before[2] + 1)
+        self.assertGreater(total, before[1])
+        self.assertIs(BaseSerializer.data, base_serializer_data)
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_READ_AFTER_WRITE=10)
+class ReplicaRouterTest(TransactionTestCase):
+    '''
+    Выбор бд для чтения. Запросы не выполняются, проверяется только
+    alias из роутера, поэтому отдельное подключение к реплике не нужно.
+    '''
+    authorization = 'Token 0123456789abcdef'
+
+    def setUp(self):
+        cache.clear()
+
+    def read_db(self, method='get', authorization=None, atomic=False):
+        '''Alias, с которого вьюха прочитала бы рецепты.'''
+        chosen = []
+
+        def get_response(request):
+            if atomic:
+                with transaction.atomic():
+                    chosen.append(Recipe.objects.all().db)
+            else:
+                chosen.append(Recipe.objects.all().db)
+            return HttpResponse()
+
+        headers = {}
+        if authorization:
+            headers['HTTP_AUTHORIZATION'] = authorization
+        request = RequestFactory().generic(
+            method.upper(), RECIPES_URL, **headers)
+        replica_middleware(get_response)(request)
+        return chosen[0]
+
+    def test_safe_request_reads_from_replica(self):
+        self.assertEqual(self.read_db(), 'replica')
+        self.assertEqual(
+            self.read_db(authorization=self.authorization), 'replica')
+
+    def test_atomic_block_reads_from_primary(self):
+        self.assertEqual(self.read_db(atomic=True), DEFAULT_DB_ALIAS)
+
+    def test_unsafe_request_reads_from_primary(self):
+        self.assertEqual(self.read_db(method='post'), DEFAULT_DB_ALIAS)
+
+    def test_read_after_write_goes_to_primary(self):
+        self.read_db(method='post', authorization=self.authorization)
+        self.assertEqual(
+            self.read_db(authorization=self.authorization), DEFAULT_DB_ALIAS)
+        self.assertEqual(
+            self.read_db(authorization='Token other'), 'replica')
+        self.assertEqual(self.read_db(), 'replica')
+
+    def test_tokens_read_from_primary(self):
+        def get_response(request):
+            chosen.append(Token.objects.all().db)
+            return HttpResponse()
+
+        chosen = []
+        replica_middleware(get_response)(RequestFactory().get(RECIPES_URL))
+        self.assertEqual(chosen, [DEFAULT_DB_ALIAS])
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from users.views import CustomUserViewSet
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import IngredientViewSet, MetricsView, RecipeViewSet, TagViewSet
 
 router = DefaultRouter()
 router.register('users', CustomUserViewSet)
@@ -12,4 +12,5 @@ router.register('ingredients', IngredientViewSet)
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ] + router.urls
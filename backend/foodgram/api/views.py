@@ -1,34 +1,52 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch, Sum,
+                              Value)
+from django.db.models.functions import Greatest
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.models import CustomUser, Follow
 from users.permissions import (IsAuthorOrAdminOrReadOnly,
                                IsUserOrAdminOrReadOnly)
 
-from . import constants
+from .async_views import AsyncReadMixin
+from .caching import (AnonymousListCacheMixin, CachedCatalogMixin,
+                      RecipeFragmentCacheMixin)
+from .constants import (BATCH_ADDED, BATCH_ALREADY_PRESENT, BATCH_NOT_FOUND,
+                        BATCH_NOT_PRESENT, BATCH_REMOVED,
+                        DEFAULT_SHOPPING_LIST_FORMAT, METRICS_CONTENT_TYPE,
+                        SHOPPING_LIST_FORMAT_PARAM)
 from .filters import IngredientsFilter, RecipesFilter
+from .metrics import render_metrics
 from .pagination import CustomApiPagination
 from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateUpdateSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          RecipeBatchSerializer, RecipeCreateUpdateSerializer,
+                          RecipeSerializer, ShoppingCartSerializer,
+                          TagSerializer)
+from .shopping_list import (SHOPPING_LIST_FORMATS, get_shopping_list,
+                            invalidate_shopping_list, shopping_list_etag,
+                            shopping_list_response)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(AsyncReadMixin, CachedCatalogMixin,
+                 viewsets.ModelViewSet):
     '''Вьюсет для тегов.'''
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsUserOrAdminOrReadOnly, )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AsyncReadMixin, AnonymousListCacheMixin,
+                    RecipeFragmentCacheMixin, viewsets.ModelViewSet):
     '''Вьюсет для рецептов.'''
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
@@ -38,10 +56,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipesFilter
 
     def get_queryset(self):
-        '''Получение queryset.'''
-        recipes = Recipe.objects.prefetch_related(
-            'recipe_ingredients__ingredient', 'tags'
-        ).all()
+        '''Получение queryset с флагами текущего пользователя.'''
+        user = self.request.user
+        if user.is_authenticated:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')))
+        else:
+            is_favorited = is_in_shopping_cart = is_subscribed = Value(
+                False, output_field=BooleanField())
+        recipes = Recipe.objects.defer('search_vector').prefetch_related(
+            'recipe_ingredients__ingredient', 'tags',
+            Prefetch('author', queryset=CustomUser.objects.annotate(
+                is_subscribed=is_subscribed))
+        ).annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart
+        )
         return recipes
 
     def get_serializer_class(self):
@@ -56,127 +90,219 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if self.request.method == 'POST':
             serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        '''Удаление рецепта с уменьшением счётчика автора.'''
+        instance.delete()
+        CustomUser.objects.filter(id=instance.author_id).update(
+            recipes_count=Greatest(F('recipes_count') - 1, 0))
+
+    def add_recipe_to(self, model, serializer_class, counter, error_message):
+        '''Добавление рецепта в избранное или список покупок.'''
+        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
+        try:
+            with transaction.atomic():
+                relation = model.objects.create(
+                    user=self.request.user, recipe=recipe)
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: F(counter) + 1})
+        except IntegrityError:
+            return Response(
+                {'errors': error_message},
+                status=status.HTTP_400_BAD_REQUEST)
+        serializer = serializer_class(relation)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipe_from(self, model, counter, error_message):
+        '''
+        Удаление рецепта из избранного или списка покупок.
+        Счётчик мог разойтись после правок в админке,
+        поэтому ниже нуля он не опускается.
+        '''
+        recipe_id = self.kwargs.get('pk')
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=self.request.user, recipe_id=recipe_id).delete()
+            if deleted:
+                Recipe.objects.filter(id=recipe_id).update(
+                    **{counter: Greatest(F(counter) - deleted, 0)})
+        if not deleted:
+            get_object_or_404(Recipe, id=self.kwargs.get('pk'))
+            return Response(
+                {'errors': error_message},
+                status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_batch(self):
+        '''Проверенный список id рецептов из тела запроса.'''
+        serializer = RecipeBatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def batch_response(self, recipe_ids, statuses):
+        return Response({'results': [
+            {'id': recipe_id, 'status': statuses.get(
+                recipe_id, BATCH_NOT_FOUND)}
+            for recipe_id in recipe_ids
+        ]}, status=status.HTTP_200_OK)
+
+    def bulk_add(self, model, counter, recipe_ids):
+        '''Добавление новых связей одним INSERT и одним UPDATE счётчиков.'''
+        user = self.request.user
+        with transaction.atomic():
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('id', flat=True))
+            present = set(model.objects.filter(
+                user=user, recipe_id__in=existing
+            ).values_list('recipe_id', flat=True))
+            added = existing - present
+            model.objects.bulk_create(
+                model(user=user, recipe_id=recipe_id) for recipe_id in added)
+            Recipe.objects.filter(id__in=added).update(
+                **{counter: F(counter) + 1})
+        return {
+            **{recipe_id: BATCH_ALREADY_PRESENT for recipe_id in present},
+            **{recipe_id: BATCH_ADDED for recipe_id in added},
+        }
+
+    def add_recipes_to(self, model, counter):
+        '''Пакетное добавление рецептов в избранное или список покупок.'''
+        recipe_ids = self.get_batch()
+        try:
+            statuses = self.bulk_add(model, counter, recipe_ids)
+        except IntegrityError:
+            # Параллельный запрос добавил те же рецепты, повтор их увидит.
+            statuses = self.bulk_add(model, counter, recipe_ids)
+        return self.batch_response(recipe_ids, statuses)
+
+    def remove_recipes_from(self, model, counter):
+        '''Пакетное удаление рецептов из избранного или списка покупок.'''
+        recipe_ids = self.get_batch()
+        user = self.request.user
+        with transaction.atomic():
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('id', flat=True))
+            # Блокировка не даёт параллельному удалению уменьшить
+            # счётчики тех же рецептов второй раз.
+            removed = set(model.objects.select_for_update().filter(
+                user=user, recipe_id__in=existing
+            ).values_list('recipe_id', flat=True))
+            model.objects.filter(user=user, recipe_id__in=removed).delete()
+            Recipe.objects.filter(id__in=removed).update(
+                **{counter: Greatest(F(counter) - 1, 0)})
+        return self.batch_response(recipe_ids, {
+            **{recipe_id: BATCH_NOT_PRESENT for recipe_id in existing},
+            **{recipe_id: BATCH_REMOVED for recipe_id in removed},
+        })
+
     @action(
         methods=[
             'post'], detail=True, permission_classes=[
                 permissions.IsAuthenticated])
     def favorite(self, request, *args, **kwargs):
         '''Добавление рецепта в избранное.'''
-        recipe = get_object_or_404(Recipe, id=kwargs.get('pk'))
-        if Favorite.objects.filter(
-                user=request.user, recipe=recipe).exists():
-            return Response(
-                {'errors': 'Этот рецепт уже в избранном.'},
-                status=status.HTTP_400_BAD_REQUEST)
-        serializer = FavoriteSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(user=request.user, recipe=recipe)
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe_to(
+            Favorite, FavoriteSerializer, 'favorites_count',
+            'Этот рецепт уже в избранном.')
 
     @favorite.mapping.delete
     def remove_from_favorite(self, request, *args, **kwargs):
         '''Удаление рецепта из избранного.'''
-        recipe = get_object_or_404(Recipe, id=kwargs.get('pk'))
-        recipe_to_del = Favorite.objects.filter(user=request.user,
-                                                recipe=recipe)
-        if recipe_to_del:
-            recipe_to_del.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
-            return Response(
-                {'errors': 'Такого рецепта в избранном нет.'},
-                status=status.HTTP_400_BAD_REQUEST)
+        return self.remove_recipe_from(
+            Favorite, 'favorites_count', 'Такого рецепта в избранном нет.')
 
     @action(methods=['post'],
             detail=True, permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, *args, **kwargs):
         '''Добавление рецепта в список покупок.'''
-        recipe = get_object_or_404(Recipe, id=kwargs.get('pk'))
-        if ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe).exists():
-            return Response(
-                {'errors': 'Рецепт уже есть в списке покупок.'},
-                status=status.HTTP_400_BAD_REQUEST)
-        serializer = ShoppingCartSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(
-                user=request.user, recipe=recipe)
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED)
+        response = self.add_recipe_to(
+            ShoppingCart, ShoppingCartSerializer, 'in_carts_count',
+            'Рецепт уже есть в списке покупок.')
+        invalidate_shopping_list(request.user.id)
+        return response
 
     @shopping_cart.mapping.delete
     def remove_from_shopping_list(self, request, *args, **kwargs):
         '''Удаление рецепта из списка покупок.'''
-        recipe = get_object_or_404(Recipe, id=kwargs.get('pk'))
-        recipe_to_del = ShoppingCart.objects.filter(
-            user=request.user, recipe=recipe)
-        if recipe_to_del:
-            recipe_to_del.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
-            return Response(
-                {'errors': 'Такого рецепта нет в списке покупок.'},
-                status=status.HTTP_400_BAD_REQUEST)
+        response = self.remove_recipe_from(
+            ShoppingCart, 'in_carts_count',
+            'Такого рецепта нет в списке покупок.')
+        invalidate_shopping_list(request.user.id)
+        return response
+
+    @action(
+        methods=['post'], detail=False, url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=[permissions.IsAuthenticated])
+    def favorite_batch(self, request, *args, **kwargs):
+        '''Добавление списка рецептов в избранное.'''
+        return self.add_recipes_to(Favorite, 'favorites_count')
+
+    @favorite_batch.mapping.delete
+    def remove_from_favorite_batch(self, request, *args, **kwargs):
+        '''Удаление списка рецептов из избранного.'''
+        return self.remove_recipes_from(Favorite, 'favorites_count')
+
+    @action(
+        methods=['post'], detail=False, url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_batch(self, request, *args, **kwargs):
+        '''Добавление списка рецептов в список покупок.'''
+        response = self.add_recipes_to(ShoppingCart, 'in_carts_count')
+        invalidate_shopping_list(request.user.id)
+        return response
+
+    @shopping_cart_batch.mapping.delete
+    def remove_from_shopping_list_batch(self, request, *args, **kwargs):
+        '''Удаление списка рецептов из списка покупок.'''
+        response = self.remove_recipes_from(ShoppingCart, 'in_carts_count')
+        invalidate_shopping_list(request.user.id)
+        return response
 
     @action(
         methods=['get'], detail=False,
         permission_classes=[permissions.IsAuthenticated])
     def download_shopping_cart(self, request, *args, **kwargs):
         '''Логика скачивания списка покупок для пользователя.'''
-        recipe_list = request.user.shopping_cart.all().values_list(
-            'recipe', flat=True)
-        recipes = Recipe.objects.filter(id__in=recipe_list)
-        recipe_ingredients = RecipeIngredient.objects.filter(
-            recipe__in=recipes).select_related('ingredient')
-        ingredients_dict = {}
-        for recipe_ingredient in recipe_ingredients:
-            measurement_unit = recipe_ingredient.ingredient.measurement_unit
-            ingredient_name = recipe_ingredient.ingredient.name
-            amount = recipe_ingredient.amount
-            ingredient_id = recipe_ingredient.ingredient.id
-            if ingredient_id in ingredients_dict:
-                ingredients_dict[ingredient_name] += amount
-                ingredients_dict[ingredient_name] = (
-                    f'{ingredients_dict[ingredient_name]}{measurement_unit}')
-            else:
-                ingredients_dict[ingredient_name] = amount
-                ingredients_dict[ingredient_name] = (
-                    f'{ingredients_dict[ingredient_name]} {measurement_unit}')
-        ingredients_list = []
-
-        for name, amount in ingredients_dict.items():
-            ingredients_list.append(f'{name}: ({amount})')
-
-        pdfmetrics.registerFont(
-            TTFont(
-                'DejaVuSans',
-                'font/DejaVuSans.ttf',
-                'utf-8'))
-
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.pdf"')
-
-        pdf = canvas.Canvas(response)
-        pdf.setFont('DejaVuSans', size=14)
-        text1 = f'{request.user}, Ваш список покупок сегодня:'
-        pdf.drawString(constants.LEFT_INDENT, constants.HEIGHT_OFFSET, text1)
-        for string in ingredients_list:
-            constants.HEIGHT_OFFSET -= 50
-            pdf.drawString(
-                constants.LEFT_INDENT, constants.HEIGHT_OFFSET, string)
-
-        pdf.showPage()
-        pdf.save()
-
-        return response
+        file_format = request.query_params.get(
+            SHOPPING_LIST_FORMAT_PARAM, DEFAULT_SHOPPING_LIST_FORMAT)
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Неподдерживаемый формат списка покупок.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__in=request.user.shopping_cart.values('recipe')
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by('ingredient__name')
+        title = f'{request.user}, Ваш список покупок сегодня:'
+        ingredients = list(ingredients)
+        etag = shopping_list_etag(title, ingredients, file_format)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        content = get_shopping_list(
+            request.user.id, title, ingredients, file_format, etag)
+        return shopping_list_response(content, file_format, etag)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(AsyncReadMixin, CachedCatalogMixin,
+                        viewsets.ModelViewSet):
     '''Вьюсет для ингредиентов.'''
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsUserOrAdminOrReadOnly, )
     filter_backends = (IngredientsFilter, )
-    search_fields = ('^name',)
+
+
+class MetricsView(APIView):
+    '''Показатели производительности в формате Prometheus.'''
+    permission_classes = (permissions.IsAdminUser, )
+
+    def get(self, request):
+        if not settings.PERFORMANCE_METRICS:
+            raise Http404
+        return HttpResponse(
+            render_metrics(), content_type=METRICS_CONTENT_TYPE)
@@ -17,6 +17,7 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInLine, )
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
 
 
 @admin.register(Ingredient)
@@ -9,3 +9,15 @@ CHOICE_COLOR = [
     (ORANGE, "Жёлтый"),
     (GREEN, "Зелёный"),
 ]
+
+# recipes/images
+IMAGE_MAX_SIZE = (1280, 1280)
+IMAGE_FORMAT = 'WEBP'
+IMAGE_EXTENSION = 'webp'
+IMAGE_QUALITY = 80
+THUMBNAIL_SIZES = {
+    'small': (320, 320),
+    'medium': (640, 640),
+}
+THUMBNAILS_DIR = 'images/thumbnails'
+IMAGE_WORKERS = 2
@@ -0,0 +1,74 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .constants import (IMAGE_EXTENSION, IMAGE_FORMAT, IMAGE_MAX_SIZE,
+                        IMAGE_QUALITY, IMAGE_WORKERS, THUMBNAIL_SIZES,
+                        THUMBNAILS_DIR)
+from .signals import image_processed
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='recipe-images')
+
+
+def thumbnail_name(image_name, size):
+    '''Путь к миниатюре заданного размера.'''
+    stem = PurePosixPath(image_name).stem
+    return f'{THUMBNAILS_DIR}/{stem}_{size}.{IMAGE_EXTENSION}'
+
+
+def encode(image, max_size):
+    '''Уменьшение и перекодирование изображения.'''
+    image = image.copy()
+    image.thumbnail(max_size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, IMAGE_FORMAT, quality=IMAGE_QUALITY, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def process_recipe_image(recipe_id, image_name):
+    '''
+    Нормализация загруженного изображения и подготовка миниатюр.
+    Запись в бд только если за это время картинку рецепта не заменили.
+    '''
+    from .models import Recipe
+
+    try:
+        with default_storage.open(image_name) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image = image.convert(
+                'RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        stem = PurePosixPath(image_name).with_suffix('')
+        normalized_name = default_storage.save(
+            f'{stem}.{IMAGE_EXTENSION}', encode(image, IMAGE_MAX_SIZE))
+        for size, max_size in THUMBNAIL_SIZES.items():
+            name = thumbnail_name(normalized_name, size)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, encode(image, max_size))
+        updated = Recipe.objects.filter(
+            id=recipe_id, image=image_name
+        ).update(image=normalized_name, image_processed=True)
+        if updated:
+            image_processed.send(sender=Recipe, recipe_id=recipe_id)
+            if normalized_name != image_name:
+                default_storage.delete(image_name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe):
+    '''Обработка изображения в фоне после фиксации транзакции.'''
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(lambda: executor.submit(
+        process_recipe_image, recipe_id, image_name))
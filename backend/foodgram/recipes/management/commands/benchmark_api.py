@@ -0,0 +1,401 @@
+import base64
+import json
+import time
+from io import BytesIO
+
+from api import urls as api_urls
+from api.authentication import forget_auth_tokens
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from PIL import Image
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser, Follow
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Размеры страницы списка рецептов без кэша: число запросов
+# от них не зависит.
+RECIPE_LIST_LIMITS = (10, 100, 1000)
+
+# Бюджеты по умолчанию: p95 в мс и наибольшее число SQL-запросов.
+BUDGETS = {
+    'api-root': {'p95_ms': 50, 'queries': 0},
+    'users list': {'p95_ms': 100, 'queries': 2},
+    'users detail': {'p95_ms': 100, 'queries': 2},
+    'users me': {'p95_ms': 100, 'queries': 1},
+    'users subscriptions': {'p95_ms': 200, 'queries': 3},
+    'users register': {'p95_ms': 600, 'queries': 3},
+    'users set_password': {'p95_ms': 800, 'queries': 3},
+    'users subscribe': {'p95_ms': 100, 'queries': 7},
+    'users unsubscribe': {'p95_ms': 100, 'queries': 3},
+    'auth login': {'p95_ms': 600, 'queries': 3},
+    'auth logout': {'p95_ms': 100, 'queries': 2},
+    'tags list': {'p95_ms': 50, 'queries': 0},
+    'tags detail': {'p95_ms': 50, 'queries': 1},
+    'ingredients search': {'p95_ms': 50, 'queries': 0},
+    'ingredients detail': {'p95_ms': 50, 'queries': 1},
+    'recipes list anonymous': {'p95_ms': 50, 'queries': 0},
+    'recipes list': {'p95_ms': 150, 'queries': 3},
+    'recipes list limit=10': {'p95_ms': 150, 'queries': 9},
+    'recipes list limit=100': {'p95_ms': 400, 'queries': 9},
+    'recipes list limit=1000': {'p95_ms': 2000, 'queries': 9},
+    'recipes list by tags': {'p95_ms': 150, 'queries': 4},
+    'recipes search': {'p95_ms': 300, 'queries': 3},
+    'recipes detail': {'p95_ms': 150, 'queries': 5},
+    'recipes create': {'p95_ms': 300, 'queries': 16},
+    'recipes update': {'p95_ms': 300, 'queries': 22},
+    'recipes delete': {'p95_ms': 200, 'queries': 14},
+    'recipes favorite': {'p95_ms': 100, 'queries': 5},
+    'recipes unfavorite': {'p95_ms': 100, 'queries': 4},
+    'recipes shopping_cart': {'p95_ms': 100, 'queries': 5},
+    'recipes remove from cart': {'p95_ms': 100, 'queries': 4},
+    'recipes favorite batch': {'p95_ms': 150, 'queries': 6},
+    'recipes unfavorite batch': {'p95_ms': 150, 'queries': 6},
+    'recipes shopping_cart batch': {'p95_ms': 150, 'queries': 6},
+    'recipes remove from cart batch': {'p95_ms': 150, 'queries': 6},
+    'recipes download_shopping_cart': {'p95_ms': 200, 'queries': 1},
+    'metrics': {'p95_ms': 100, 'queries': 0},
+}
+
+
+def tiny_image():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), (120, 60, 30)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class Scenario:
+    '''Один замеряемый запрос к api.'''
+
+    def __init__(self, label, url_name, method='get', kwargs=None,
+                 query='', data=None, user='user', status=200, setup=None):
+        self.label = label
+        self.url_name = url_name
+        self.method = method
+        self.kwargs = kwargs
+        self.query = query
+        self.data = data
+        self.user = user
+        self.status = status
+        self.setup = setup
+
+
+def scenarios(context):
+    '''Запросы ко всем адресам api/urls.py.'''
+    recipe = context['recipe']
+    own = context['own_recipe']
+    author = context['author']
+    user = context['user']
+    tags = [tag.slug for tag in context['tags'][:2]]
+    menu = context['menu']
+    batch = {'recipes': [item.id for item in menu]}
+    recipe_data = {
+        'name': 'Замер',
+        'text': 'Замер',
+        'cooking_time': 10,
+        'image': tiny_image(),
+        'tags': [tag.id for tag in context['tags'][:2]],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in context['ingredients']
+        ],
+    }
+
+    def set_password():
+        user.set_password(BENCHMARK_PASSWORD)
+        user.save(update_fields=['password'])
+        # Транзакция откатывается, on_commit не сбросит кэш токена.
+        forget_auth_tokens(Token.objects.filter(user=user).values_list(
+            'key', flat=True))
+
+    def counter(model, field, value, recipes=(recipe,)):
+        def setup():
+            model.objects.filter(user=user, recipe__in=recipes).delete()
+            if value:
+                model.objects.bulk_create(
+                    model(user=user, recipe=item) for item in recipes)
+            for item in recipes:
+                Recipe.objects.filter(id=item.id).update(**{
+                    field: model.objects.filter(recipe=item).count()})
+        return setup
+
+    def follow(value):
+        def setup():
+            Follow.objects.filter(user=user, author=author).delete()
+            if value:
+                Follow.objects.create(user=user, author=author)
+        return setup
+
+    return [
+        Scenario('api-root', 'api-root'),
+        Scenario('users list', 'customuser-list', user=None),
+        Scenario('users detail', 'customuser-detail', kwargs={
+            'pk': author.id}),
+        Scenario('users me', 'customuser-me'),
+        Scenario(
+            'users subscriptions', 'customuser-subscriptions',
+            query='?recipes_limit=3'),
+        Scenario(
+            'users register', 'customuser-list', method='post', user=None,
+            data=lambda index: {
+                'email': f'benchmark{index}@example.com',
+                'username': f'benchmark{index}',
+                'first_name': 'Замер',
+                'last_name': 'Замер',
+                'password': BENCHMARK_PASSWORD,
+            }, status=201),
+        Scenario(
+            'users set_password', 'customuser-set-password', method='post',
+            data={
+                'current_password': BENCHMARK_PASSWORD,
+                'new_password': BENCHMARK_PASSWORD + '-new',
+            }, status=204, setup=set_password),
+        Scenario(
+            'users subscribe', 'customuser-subscribe', method='post',
+            kwargs={'pk': author.id}, status=201, setup=follow(False)),
+        Scenario(
+            'users unsubscribe', 'customuser-subscribe', method='delete',
+            kwargs={'pk': author.id}, status=204, setup=follow(True)),
+        Scenario(
+            'auth login', 'login', method='post', user=None, data={
+                'email': user.email, 'password': BENCHMARK_PASSWORD,
+            }, setup=set_password),
+        Scenario('auth logout', 'logout', method='post', status=204),
+        Scenario('tags list', 'tag-list', user=None),
+        Scenario('tags detail', 'tag-detail', kwargs={
+            'pk': context['tags'][0].id}, user=None),
+        Scenario(
+            'ingredients search', 'ingredient-list', user=None,
+            query=f'?name={context["ingredient"].name[:3]}'),
+        Scenario('ingredients detail', 'ingredient-detail', kwargs={
+            'pk': context['ingredient'].id}, user=None),
+        Scenario('recipes list anonymous', 'recipe-list', user=None),
+        Scenario('recipes list', 'recipe-list'),
+        *(
+            Scenario(
+                f'recipes list limit={limit}', 'recipe-list',
+                query=f'?limit={limit}', setup=cache.clear)
+            for limit in RECIPE_LIST_LIMITS
+        ),
+        Scenario(
+            'recipes list by tags', 'recipe-list',
+            query='?' + '&'.join(f'tags={slug}' for slug in tags)),
+        Scenario(
+            'recipes search', 'recipe-list',
+            query=f'?search={recipe.name.split()[0]}'),
+        Scenario('recipes detail', 'recipe-detail', kwargs={
+            'pk': recipe.id}),
+        Scenario(
+            'recipes create', 'recipe-list', method='post',
+            data=recipe_data, status=201),
+        Scenario(
+            'recipes update', 'recipe-detail', method='patch',
+            kwargs={'pk': own.id}, data=recipe_data),
+        Scenario(
+            'recipes delete', 'recipe-detail', method='delete',
+            kwargs={'pk': own.id}, status=204),
+        Scenario(
+            'recipes favorite', 'recipe-favorite', method='post',
+            kwargs={'pk': recipe.id}, status=201,
+            setup=counter(Favorite, 'favorites_count', False)),
+        Scenario(
+            'recipes unfavorite', 'recipe-favorite', method='delete',
+            kwargs={'pk': recipe.id}, status=204,
+            setup=counter(Favorite, 'favorites_count', True)),
+        Scenario(
+            'recipes shopping_cart', 'recipe-shopping-cart', method='post',
+            kwargs={'pk': recipe.id}, status=201,
+            setup=counter(ShoppingCart, 'in_carts_count', False)),
+        Scenario(
+            'recipes remove from cart', 'recipe-shopping-cart',
+            method='delete', kwargs={'pk': recipe.id}, status=204,
+            setup=counter(ShoppingCart, 'in_carts_count', True)),
+        Scenario(
+            'recipes favorite batch', 'recipe-favorite-batch',
+            method='post', data=batch,
+            setup=counter(Favorite, 'favorites_count', False, menu)),
+        Scenario(
+            'recipes unfavorite batch', 'recipe-favorite-batch',
+            method='delete', data=batch,
+            setup=counter(Favorite, 'favorites_count', True, menu)),
+        Scenario(
+            'recipes shopping_cart batch', 'recipe-shopping-cart-batch',
+            method='post', data=batch,
+            setup=counter(ShoppingCart, 'in_carts_count', False, menu)),
+        Scenario(
+            'recipes remove from cart batch', 'recipe-shopping-cart-batch',
+            method='delete', data=batch,
+            setup=counter(ShoppingCart, 'in_carts_count', True, menu)),
+        Scenario(
+            'recipes download_shopping_cart',
+            'recipe-download-shopping-cart'),
+        Scenario(
+            'metrics', 'metrics', user='staff',
+            status=200 if settings.PERFORMANCE_METRICS else 404),
+    ]
+
+
+def url_names(patterns):
+    '''Имена всех адресов, включая вложенные include.'''
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.name:
+                names.add(pattern.name)
+        else:
+            names |= url_names(pattern.url_patterns)
+    return names
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = 'Замер задержек и SQL-запросов всех адресов api с бюджетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Количество замеров на каждый запрос')
+        parser.add_argument(
+            '--username', help='Пользователь для запросов с авторизацией')
+        parser.add_argument(
+            '--budgets', help='JSON-файл с бюджетами вместо встроенных')
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Замерить только запросы с этими подписями')
+
+    def handle(self, *args, **options):
+        '''Прогон всех сценариев и проверка бюджетов'''
+        budgets = BUDGETS
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as file:
+                budgets = {**BUDGETS, **json.load(file)}
+        context = self.get_context(options['username'])
+        clients = self.get_clients(context)
+        all_scenarios = scenarios(context)
+        missing = url_names(api_urls.urlpatterns) - {
+            scenario.url_name for scenario in all_scenarios}
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'Без замеров: {", ".join(sorted(missing))}'))
+        failures = []
+        self.stdout.write(
+            f'{"запрос":<32} {"p50 мс":>8} {"p95 мс":>8} {"SQL":>5}')
+        for scenario in all_scenarios:
+            if options['only'] and scenario.label not in options['only']:
+                continue
+            client = clients.get(scenario.user)
+            if scenario.user and client is None:
+                self.stdout.write(f'{scenario.label:<32} пропущен')
+                continue
+            timings, queries = self.run_scenario(
+                client or Client(), scenario, options['requests'])
+            p50 = percentile(timings, 0.5) * 1000
+            p95 = percentile(timings, 0.95) * 1000
+            self.stdout.write(
+                f'{scenario.label:<32} {p50:8.1f} {p95:8.1f} {queries:5}')
+            budget = budgets.get(scenario.label, {})
+            if p95 > budget.get('p95_ms', float('inf')):
+                failures.append(
+                    f'{scenario.label}: p95 {p95:.1f} мс '
+                    f'> {budget["p95_ms"]} мс')
+            if queries > budget.get('queries', float('inf')):
+                failures.append(
+                    f'{scenario.label}: {queries} SQL '
+                    f'> {budget["queries"]}')
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены.'))
+
+    def get_context(self, username):
+        '''Пользователь и объекты, к которым обращаются сценарии'''
+        users = CustomUser.objects.filter(recipe__isnull=False)
+        if username:
+            users = CustomUser.objects.filter(username=username)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError(
+                'Нет подходящего пользователя, запустите generate_dataset.')
+        own_recipe = Recipe.objects.filter(author=user).first()
+        recipe = Recipe.objects.exclude(author=user).first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        tags = list(Tag.objects.order_by('id')[:2])
+        if None in (own_recipe, recipe, ingredient) or not tags:
+            raise CommandError(
+                'Нужны рецепты пользователя и других авторов, теги и '
+                'ингредиенты, запустите generate_dataset.')
+        return {
+            'user': user,
+            'author': recipe.author,
+            'recipe': recipe,
+            'own_recipe': own_recipe,
+            'ingredient': ingredient,
+            'ingredients': list(Ingredient.objects.order_by(
+                'id').values_list('id', flat=True)[:5]),
+            'menu': list(Recipe.objects.exclude(author=user)[:7]),
+            'tags': tags,
+            'staff': CustomUser.objects.filter(is_staff=True).first(),
+        }
+
+    def get_clients(self, context):
+        '''Клиенты с токенами пользователя и сотрудника'''
+        clients = {}
+        for role in ('user', 'staff'):
+            user = context[role]
+            if user is None:
+                continue
+            token, _ = Token.objects.get_or_create(user=user)
+            clients[role] = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return clients
+
+    def run_scenario(self, client, scenario, requests):
+        '''Замеры запроса, каждый в откатываемой транзакции'''
+        path = reverse(scenario.url_name, kwargs=scenario.kwargs)
+        path += scenario.query
+        timings = []
+        queries = 0
+        for index in range(requests + 1):
+            data = scenario.data
+            if callable(data):
+                data = data(index)
+            with transaction.atomic():
+                if scenario.setup:
+                    scenario.setup()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, scenario.method)(
+                        path, data=json.dumps(data) if data else None,
+                        content_type='application/json')
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if response.status_code != scenario.status:
+                raise CommandError(
+                    f'{scenario.label}: {response.status_code} '
+                    f'{response.content[:300]}')
+            if scenario.method in ('post', 'patch'):
+                self.delete_image(response)
+            if index:
+                timings.append(elapsed)
+                queries = max(queries, len(captured.captured_queries))
+        return timings, queries
+
+    def delete_image(self, response):
+        '''Удаление картинки откатанного рецепта'''
+        url = response.json().get('image') if response.content else None
+        if not url:
+            return
+        name = url.split(settings.MEDIA_URL, 1)[-1]
+        if default_storage.exists(name):
+            default_storage.delete(name)
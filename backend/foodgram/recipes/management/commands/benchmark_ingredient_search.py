@@ -0,0 +1,96 @@
+import statistics
+import time
+from itertools import islice
+from types import SimpleNamespace
+
+from api.constants import INGREDIENTS_SUBSTRING_MIN_LENGTH
+from api.filters import IngredientsFilter
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from recipes.models import Ingredient
+from rest_framework.request import Request
+
+BATCH_SIZE = 5000
+WORDS = (
+    'молоко', 'мука', 'морковь', 'масло', 'мёд', 'сахар', 'соль', 'сыр',
+    'томат', 'творог', 'перец', 'петрушка', 'лук', 'лавровый лист',
+    'картофель', 'капуста', 'говядина', 'горох', 'яйцо', 'укроп',
+)
+QUERIES = ('мо', 'мол', 'ука', 'лавр', 'ерец', 'zz')
+
+
+def ingredients(count, start):
+    '''Названия из словаря с номером, уникальные для ограничения модели.'''
+    for index in range(start, start + count):
+        yield Ingredient(
+            name=f'{WORDS[index % len(WORDS)]} {index}',
+            measurement_unit='г')
+
+
+def search(queryset, name):
+    '''Поиск тем же фильтром, что и у списка ингредиентов.'''
+    request = Request(RequestFactory().get('/', {'name': name}))
+    view = SimpleNamespace(action='list')
+    return IngredientsFilter().filter_queryset(request, queryset, view)
+
+
+class Command(BaseCommand):
+    help = 'Замер поиска ингредиентов по началу названия и подстроке'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[2000, 100000, 1000000],
+            help='Размеры справочника ингредиентов')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество замеров на каждый запрос')
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Показать план запросов на PostgreSQL')
+
+    def handle(self, *args, **options):
+        '''Каждый размер в откатываемой транзакции'''
+        self.stdout.write(
+            f'{"размер":>9} {"запрос":<8} {"тип":<9} {"мс":>8} '
+            f'{"найдено":>8}')
+        existing = Ingredient.objects.count()
+        for size in sorted(options['sizes']):
+            if size < existing:
+                self.stdout.write(self.style.WARNING(
+                    f'В справочнике уже {existing} ингредиентов, '
+                    f'размер {size} пропущен.'))
+                continue
+            with transaction.atomic():
+                self.fill(existing, size)
+                for name in QUERIES:
+                    self.measure(size, name, options)
+                transaction.set_rollback(True)
+
+    def fill(self, existing, size):
+        '''Дополнение справочника до нужного размера'''
+        objs = ingredients(size - existing, existing)
+        while True:
+            batch = list(islice(objs, BATCH_SIZE))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE recipes_ingredient')
+
+    def measure(self, size, name, options):
+        '''Медиана одного поискового запроса'''
+        queryset = search(Ingredient.objects.all(), name)
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            found = len(list(queryset.all()))
+            timings.append(time.perf_counter() - started)
+        kind = ('начало' if len(name) < INGREDIENTS_SUBSTRING_MIN_LENGTH
+                else 'подстрока')
+        self.stdout.write(
+            f'{size:9} {name:<8} {kind:<9} '
+            f'{statistics.median(timings) * 1000:8.2f} {found:8}')
+        if options['explain'] and connection.vendor == 'postgresql':
+            self.stdout.write(queryset.explain(analyze=True))
@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser
+
+MODES = {
+    'wsgi': 'False',
+    'asgi-sync': 'False',
+    'asgi-async': 'True',
+}
+
+
+def endpoints():
+    '''Адреса горячих запросов на чтение.'''
+    recipe = Recipe.objects.order_by('-id').first()
+    if recipe is None:
+        raise CommandError('Нужен хотя бы один рецепт.')
+    return (
+        '/api/recipes/',
+        f'/api/recipes/{recipe.id}/',
+        '/api/tags/',
+        '/api/ingredients/',
+    )
+
+
+def add_latency(seconds):
+    '''Задержка на каждый запрос к бд, как у сетевой СУБД.'''
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(install, weak=False)
+
+
+def wsgi_request(handler, path, headers):
+    '''Один GET-запрос через WSGI-обработчик.'''
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.input': sys.stdin.buffer,
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        **{
+            'HTTP_' + name.upper().replace('-', '_'): value
+            for name, value in headers.items()
+        },
+    }
+    statuses = []
+    response = handler(environ, lambda status, *args: statuses.append(status))
+    content = b''.join(response)
+    response.close()
+    return int(statuses[0].split()[0]), content
+
+
+async def asgi_request(handler, path, headers):
+    '''Один GET-запрос через ASGI-обработчик.'''
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'localhost')] + [
+            (name.lower().encode(), value.encode())
+            for name, value in headers.items()
+        ],
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 0),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    content = b''.join(
+        message.get('body', b'') for message in messages
+        if message['type'] == 'http.response.body')
+    return messages[0]['status'], content
+
+
+def run_wsgi(path, headers, requests, concurrency):
+    '''Запросы из пула потоков, как у gunicorn с потоками.'''
+    handler = WSGIHandler()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(
+            lambda _: wsgi_request(handler, path, headers), range(requests)))
+
+
+def run_asgi(path, headers, requests, concurrency):
+    '''Запросы конкурентными корутинами в одном цикле событий.'''
+    handler = ASGIHandler()
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await asgi_request(handler, path, headers)
+
+        return await asyncio.gather(*(limited() for _ in range(requests)))
+
+    return asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Сравнение пропускной способности чтения под WSGI и ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Количество запросов на каждый адрес')
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Количество одновременных запросов')
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Искусственная задержка запроса к бд, мс')
+        parser.add_argument(
+            '--username', help='Запросы от имени пользователя')
+        parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        '''Запуск каждого режима в отдельном процессе'''
+        if options['mode']:
+            self.stdout.write(json.dumps(self.run_worker(options)))
+            return
+        self.stdout.write(
+            f'Запросов на адрес: {options["requests"]}, '
+            f'одновременно: {options["concurrency"]}, '
+            f'задержка бд: {options["db_latency"]} мс')
+        digests = {}
+        for mode, async_reads in MODES.items():
+            command = [
+                sys.executable, sys.argv[0], 'benchmark_reads',
+                '--mode', mode,
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency']),
+                '--db-latency', str(options['db_latency']),
+            ]
+            if options['username']:
+                command += ['--username', options['username']]
+            process = subprocess.run(
+                command, capture_output=True, text=True,
+                env={**os.environ, 'ASYNC_READ_VIEWS': async_reads})
+            if process.returncode:
+                raise CommandError(process.stderr)
+            result = json.loads(process.stdout.splitlines()[-1])
+            for path, (rps, digest) in result.items():
+                self.stdout.write(f'{mode:>10} {path:<24} {rps:8.0f} rps')
+                digests.setdefault(path, set()).add(digest)
+        for path, found in digests.items():
+            if len(found) > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'Ответы {path} отличаются между режимами.'))
+
+    def run_worker(self, options):
+        '''Замер одного режима по всем адресам'''
+        headers = {}
+        if options['username']:
+            user = CustomUser.objects.filter(
+                username=options['username']).first()
+            if user is None:
+                raise CommandError('Пользователь не найден.')
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+        if options['db_latency']:
+            add_latency(options['db_latency'] / 1000)
+        run = run_wsgi if options['mode'] == 'wsgi' else run_asgi
+        result = {}
+        for path in endpoints():
+            run(path, headers, 1, 1)
+            started = time.perf_counter()
+            responses = run(
+                path, headers, options['requests'], options['concurrency'])
+            elapsed = time.perf_counter() - started
+            for status, content in responses:
+                if status != 200:
+                    raise CommandError(f'{path}: {status} {content[:200]}')
+            result[path] = (
+                options['requests'] / elapsed,
+                sha256(responses[0][1]).hexdigest(),
+            )
+        return result
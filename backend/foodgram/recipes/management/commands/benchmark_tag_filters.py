@@ -0,0 +1,81 @@
+import statistics
+import time
+from itertools import combinations
+
+from api.constants import PAGE_SIZE, TAGS_MATCH_ALL, TAGS_MATCH_ANY
+from api.filters import RecipesFilter
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe, Tag
+
+
+def join_filter(tags, match):
+    '''Прежняя фильтрация соединением с таблицей тегов и DISTINCT.'''
+    recipes = Recipe.objects.all()
+    if match == TAGS_MATCH_ANY:
+        return recipes.filter(tags__in=tags).distinct()
+    for tag in tags:
+        recipes = recipes.filter(tags=tag)
+    return recipes.distinct()
+
+
+def exists_filter(tags, match):
+    '''Фильтрация RecipesFilter через EXISTS.'''
+    data = {'tags': [tag.slug for tag in tags], 'tags_match': match}
+    filterset = RecipesFilter(data, queryset=Recipe.objects.all())
+    if not filterset.is_valid():
+        raise CommandError(filterset.errors)
+    return filterset.qs
+
+
+def measure(queryset, repeat):
+    '''Медиана COUNT и выборки первой страницы, мс'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = queryset.count()
+        page = list(queryset.values_list('id', flat=True)[:PAGE_SIZE])
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, count, page
+
+
+class Command(BaseCommand):
+    help = 'Сравнение фильтрации рецептов по тегам: JOIN и EXISTS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество замеров на каждое сочетание')
+        parser.add_argument(
+            '--max-tags', type=int, default=3,
+            help='Наибольшее количество тегов в сочетании')
+
+    def handle(self, *args, **options):
+        '''Замер всех сочетаний тегов в режимах any и all'''
+        tags = list(Tag.objects.order_by('id'))
+        if not tags:
+            raise CommandError('Нужен хотя бы один тег.')
+        self.stdout.write(
+            f'{"теги":<28} {"режим":<5} {"JOIN мс":>8} {"EXISTS мс":>10} '
+            f'{"рецептов":>9} {"дублей":>7}')
+        for size in range(1, min(options['max_tags'], len(tags)) + 1):
+            for combination in combinations(tags, size):
+                for match in (TAGS_MATCH_ANY, TAGS_MATCH_ALL):
+                    if size == 1 and match == TAGS_MATCH_ALL:
+                        continue
+                    self.compare(combination, match, options['repeat'])
+
+    def compare(self, tags, match, repeat):
+        '''Одно сочетание тегов: время, число рецептов и дубли JOIN'''
+        join_ms, join_count, join_page = measure(
+            join_filter(tags, match), repeat)
+        exists_ms, count, page = measure(exists_filter(tags, match), repeat)
+        if (join_count, join_page) != (count, page):
+            raise CommandError(
+                f'Результаты для {match} {tags} различаются.')
+        duplicates = 0
+        if match == TAGS_MATCH_ANY:
+            duplicates = Recipe.objects.filter(tags__in=tags).count() - count
+        label = ','.join(tag.slug for tag in tags)
+        self.stdout.write(
+            f'{label:<28} {match:<5} {join_ms:8.1f} {exists_ms:10.1f} '
+            f'{count:9} {duplicates:7}')
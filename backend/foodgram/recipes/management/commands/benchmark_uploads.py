@@ -0,0 +1,195 @@
+import argparse
+import base64
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from PIL import Image
+from recipes.models import Ingredient, Tag
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser
+
+MODES = ('base64', 'multipart')
+BOUNDARY = 'foodgram-benchmark-boundary'
+CHUNK_SIZE = 3 * 64 * 1024
+RECIPES_URL = '/api/recipes/'
+
+
+def write_base64_body(body, image_path, fields):
+    '''JSON-тело с картинкой в base64, кодируется на диск по частям.'''
+    payload = json.dumps({**fields, 'image': ''})
+    head, tail = payload.rsplit('""', 1)
+    body.write(f'{head}"data:image/jpeg;base64,'.encode())
+    with open(image_path, 'rb') as image:
+        for chunk in iter(lambda: image.read(CHUNK_SIZE), b''):
+            body.write(base64.b64encode(chunk))
+    body.write(f'"{tail}'.encode())
+    return 'application/json'
+
+
+def write_multipart_body(body, image_path, fields):
+    '''Multipart-тело с картинкой файлом, копируется на диск по частям.'''
+    for name, value in fields.items():
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        body.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; '
+            f'name="{name}"\r\n\r\n{value}\r\n'.encode())
+    body.write(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; '
+        f'filename="benchmark.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode())
+    with open(image_path, 'rb') as image:
+        for chunk in iter(lambda: image.read(CHUNK_SIZE), b''):
+            body.write(chunk)
+    body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+    return f'multipart/form-data; boundary={BOUNDARY}'
+
+
+BODY_WRITERS = {
+    'base64': write_base64_body,
+    'multipart': write_multipart_body,
+}
+
+
+def peak_rss():
+    '''Пиковый RSS процесса в МиБ.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Сравнение памяти и времени загрузки картинки рецепта'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=5,
+            help='Количество запросов на каждый способ загрузки')
+        parser.add_argument(
+            '--width', type=int, default=4000, help='Ширина картинки')
+        parser.add_argument(
+            '--height', type=int, default=3000, help='Высота картинки')
+        parser.add_argument(
+            '--username',
+            help='Автор рецептов, по умолчанию суперпользователь')
+        parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+        parser.add_argument('--image', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        '''Запуск каждого способа в отдельном процессе'''
+        if options['mode']:
+            result = self.run_worker(options)
+            self.stdout.write(json.dumps(result))
+            return
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'benchmark.jpg')
+            Image.effect_noise(
+                (options['width'], options['height']), 64
+            ).convert('RGB').save(image_path, 'JPEG', quality=95)
+            size = os.path.getsize(image_path) / 1024 / 1024
+            self.stdout.write(
+                f'Картинка {options["width"]}x{options["height"]}, '
+                f'{size:.1f} МиБ, запросов: {options["requests"]}')
+            for mode in MODES:
+                command = [
+                    sys.executable, sys.argv[0], 'benchmark_uploads',
+                    '--mode', mode, '--image', image_path,
+                    '--requests', str(options['requests']),
+                ]
+                if options['username']:
+                    command += ['--username', options['username']]
+                process = subprocess.run(
+                    command, capture_output=True, text=True)
+                if process.returncode:
+                    raise CommandError(process.stderr)
+                result = json.loads(process.stdout.splitlines()[-1])
+                self.stdout.write(
+                    f'{mode:>9}: тело {result["body_mb"]:.1f} МиБ, '
+                    f'медиана {result["median_ms"]:.0f} мс, '
+                    f'пиковый RSS {result["peak_rss_mb"]:.0f} МиБ '
+                    f'(+{result["peak_rss_mb"] - result["start_rss_mb"]:.0f})')
+
+    def run_worker(self, options):
+        '''Запросы через WSGI-обработчик с телом, читаемым с диска'''
+        author = self.get_author(options['username'])
+        token, _ = Token.objects.get_or_create(user=author)
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if tag is None or ingredient is None:
+            raise CommandError('Нужен хотя бы один тег и ингредиент.')
+        fields = {
+            'name': 'Benchmark',
+            'text': 'Benchmark',
+            'cooking_time': 1,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+        }
+        handler = WSGIHandler()
+        # Каждый запрос откатывается, соединение нельзя закрывать между ними.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        with tempfile.TemporaryFile() as body:
+            content_type = BODY_WRITERS[options['mode']](
+                body, options['image'], fields)
+            length = body.tell()
+            start_rss = peak_rss()
+            timings = []
+            for _ in range(options['requests']):
+                body.seek(0)
+                environ = {
+                    'REQUEST_METHOD': 'POST',
+                    'PATH_INFO': RECIPES_URL,
+                    'SCRIPT_NAME': '',
+                    'QUERY_STRING': '',
+                    'SERVER_NAME': 'localhost',
+                    'SERVER_PORT': '80',
+                    'CONTENT_TYPE': content_type,
+                    'CONTENT_LENGTH': str(length),
+                    'HTTP_AUTHORIZATION': f'Token {token.key}',
+                    'wsgi.input': body,
+                    'wsgi.errors': sys.stderr,
+                    'wsgi.url_scheme': 'http',
+                }
+                started = time.perf_counter()
+                with transaction.atomic():
+                    response = handler(environ, lambda *args: None)
+                    content = b''.join(response)
+                    transaction.set_rollback(True)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 201:
+                    raise CommandError(content.decode())
+                self.delete_image(json.loads(content)['image'])
+        return {
+            'body_mb': length / 1024 / 1024,
+            'median_ms': statistics.median(timings) * 1000,
+            'start_rss_mb': start_rss,
+            'peak_rss_mb': peak_rss(),
+        }
+
+    def get_author(self, username):
+        '''Автор тестовых рецептов'''
+        users = CustomUser.objects.all()
+        if username:
+            users = users.filter(username=username)
+        else:
+            users = users.filter(is_superuser=True)
+        author = users.first()
+        if author is None:
+            raise CommandError('Пользователь для запросов не найден.')
+        return author
+
+    def delete_image(self, url):
+        '''Удаление картинки откатанного рецепта'''
+        name = url.split(settings.MEDIA_URL, 1)[-1]
+        if default_storage.exists(name):
+            default_storage.delete(name)
@@ -0,0 +1,198 @@
+import random
+import time
+from io import BytesIO
+from itertools import islice
+
+from api.caching import bump_catalog_version, bump_recipe_fragments
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes.constants import CHOICE_COLOR
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import CustomUser, Follow
+
+BATCH_SIZE = 1000
+DATASET_PASSWORD = 'synthetic-password'
+IMAGE_NAME = 'images/synthetic.jpg'
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'паста', 'плов',
+    'омлет', 'блины', 'котлеты', 'гуляш', 'борщ', 'соус', 'десерт', 'хлеб',
+)
+
+
+def tag_colors():
+    '''Свободные цвета из справочника, дальше детерминированные hex-коды.'''
+    used = set(Tag.objects.values_list('color', flat=True))
+    for color, _ in CHOICE_COLOR:
+        if color not in used:
+            yield color
+    index = 0
+    while True:
+        index += 1
+        color = f'#{index * 2654435761 % 0xFFFFFF:06X}'
+        if color not in used:
+            yield color
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100, help='Количество пользователей')
+        parser.add_argument(
+            '--recipes', type=int, default=10,
+            help='Рецептов на пользователя')
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Ингредиентов в рецепте')
+        parser.add_argument(
+            '--tags', type=int, default=3, help='Количество тегов')
+        parser.add_argument(
+            '--follows', type=int, default=5,
+            help='Подписок на пользователя')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в списке покупок у пользователя')
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Префикс имён пользователей')
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Зерно генератора')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном INSERT')
+
+    def handle(self, *args, **options):
+        '''Создание набора данных одной транзакцией'''
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix.')
+        if not Ingredient.objects.exists():
+            call_command('import_csv', stdout=self.stdout)
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            tags = self.create_tags(options['tags'])
+            users = self.create_users(prefix, options['users'])
+            recipes = self.create_recipes(
+                users, tags, options['recipes'], options['ingredients'])
+            self.create_relations(users, recipes, options)
+        call_command(
+            'reconcile_counters', batch_size=self.batch_size,
+            stdout=self.stdout)
+        bump_catalog_version(Tag)
+        bump_catalog_version(Recipe)
+        bump_recipe_fragments()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'{time.perf_counter() - started:.1f} с. '
+            f'Пароль пользователей: {DATASET_PASSWORD}'))
+
+    def bulk_create(self, model, objs, **kwargs):
+        '''Вставка пачками без построения всего списка в памяти'''
+        objs = iter(objs)
+        while True:
+            batch = list(islice(objs, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, **kwargs)
+
+    def create_tags(self, count):
+        '''Недостающие теги до заданного количества'''
+        existing = Tag.objects.count()
+        self.bulk_create(Tag, (
+            Tag(name=f'Тег {index}', slug=f'tag-{index}', color=color)
+            for index, color in zip(range(existing, count), tag_colors())
+        ))
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, prefix, count):
+        '''Пользователи с одним заранее посчитанным хэшем пароля'''
+        password = make_password(DATASET_PASSWORD)
+        self.bulk_create(CustomUser, (
+            CustomUser(
+                username=f'{prefix}{index}',
+                email=f'{prefix}{index}@example.com',
+                first_name=f'Имя{index}',
+                last_name=f'Фамилия{index}',
+                password=password,
+            )
+            for index in range(count)
+        ))
+        return list(CustomUser.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, users, tags, per_user, per_recipe):
+        '''Рецепты с ингредиентами из справочника и тегами'''
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (640, 480), (230, 180, 90)).save(buffer, 'JPEG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        rng = self.rng
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                text=' '.join(rng.choices(WORDS, k=30)),
+                image=IMAGE_NAME,
+                cooking_time=rng.randint(5, 180),
+            )
+            for author_id in users for _ in range(per_user)
+        ))
+        recipes = list(Recipe.objects.filter(
+            id__gt=last_id, author__in=users
+        ).order_by('id').values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.order_by(
+            'id').values_list('id', flat=True))
+        per_recipe = min(per_recipe, len(ingredients))
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500))
+            for recipe_id in recipes
+            for ingredient_id in rng.sample(ingredients, per_recipe)
+        ))
+        through = Recipe.tags.through
+        self.bulk_create(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in (
+                rng.sample(tags, rng.randint(1, len(tags))) if tags else ())
+        ))
+        return recipes
+
+    def create_relations(self, users, recipes, options):
+        '''Подписки, избранное и списки покупок'''
+        rng = self.rng
+        follows = min(options['follows'], len(users) - 1)
+        self.bulk_create(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in [
+                author_id for author_id in rng.sample(users, follows + 1)
+                if author_id != user_id
+            ][:follows]
+        ))
+        for model, count in ((Favorite, options['favorites']),
+                             (ShoppingCart, options['cart'])):
+            count = min(count, len(recipes))
+            self.bulk_create(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in rng.sample(recipes, count)
+            ))
@@ -1,16 +1,98 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
+import csv
+import json
+import time
+from itertools import islice
+
+from api.caching import bump_catalog_version
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
 
+DEFAULT_PATH = 'data/ingredients.csv'
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    '''Построчное чтение ингредиентов из CSV.'''
+    for row in csv.DictReader(file):
+        yield row['name'], row['measurement_unit']
+
+
+def read_json(file):
+    '''Потоковое чтение JSON-массива ингредиентов по частям.'''
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            if buffer[position:].strip():
+                raise CommandError('Некорректный JSON.')
+            return
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
-    help = 'Импорт данных из CSV в бд'
+    help = 'Импорт ингредиентов из CSV или JSON в бд'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Путь к файлу .csv или .json')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном INSERT')
 
     def handle(self, *args, **options):
         '''Иморт данных для ингредиентов'''
-        df = pd.read_csv('data/ingredients.csv')
-        for import_name, import_measurement_unit in zip(
-                df.name, df.measurement_unit):
-            models = Ingredient(
-                name=import_name, measurement_unit=import_measurement_unit)
-            models.save()
+        path = settings.BASE_DIR / options['path']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        batch_size = options['batch_size']
+        count_before = Ingredient.objects.count()
+        processed = 0
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - count_before
+        if created:
+            bump_catalog_version(Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'{processed / elapsed:.0f} строк/с.'))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import CustomUser
+
+BATCH_SIZE = 1000
+
+
+def count_of(model, field):
+    '''Подзапрос с количеством строк model, ссылающихся на объект.'''
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).values(
+            field).annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, {
+        'favorites_count': count_of(Favorite, 'recipe'),
+        'in_carts_count': count_of(ShoppingCart, 'recipe'),
+    }),
+    (CustomUser, {
+        'recipes_count': count_of(Recipe, 'author'),
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт денормализованных счётчиков пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном UPDATE')
+
+    def handle(self, *args, **options):
+        '''Пересчёт счётчиков рецептов и пользователей'''
+        batch_size = options['batch_size']
+        for model, counters in COUNTERS:
+            fixed = 0
+            last_id = 0
+            while True:
+                ids = list(model.objects.filter(id__gt=last_id).order_by(
+                    'id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                with transaction.atomic():
+                    drifted = list(model.objects.filter(
+                        id__in=ids
+                    ).annotate(**{
+                        f'actual_{counter}': expression
+                        for counter, expression in counters.items()
+                    }).exclude(**{
+                        counter: F(f'actual_{counter}') for counter in counters
+                    }).values_list('id', flat=True))
+                    if drifted:
+                        fixed += model.objects.filter(
+                            id__in=drifted).update(**counters)
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}.'))
@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 19:52
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Вектор поиска с названием (вес A) выше текста (вес B).
+# Существующие строки заполняются до создания триггера, дальше триггер
+# пересчитывает вектор при записи названия или текста,
+# счётчики через update() его не трогают.
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({row}text, '')), 'B')"
+)
+CREATE_SEARCH = (
+    'CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update() '
+    'RETURNS trigger AS $$ BEGIN '
+    f'NEW.search_vector := {SEARCH_VECTOR.format(row="NEW.")}; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    f'UPDATE recipes_recipe SET search_vector = {SEARCH_VECTOR.format(row="")}',
+    'CREATE TRIGGER recipes_recipe_search_vector_update '
+    'BEFORE INSERT OR UPDATE OF name, text, search_vector '
+    'ON recipes_recipe FOR EACH ROW '
+    'EXECUTE FUNCTION recipes_recipe_search_vector_update()',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+DROP_SEARCH = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_update '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+)
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipe_image_processed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SEARCH),
+            run_on_postgresql(DROP_SEARCH)),
+    ]
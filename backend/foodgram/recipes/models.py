@@ -1,7 +1,9 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from users.models import CustomUser
 
-from .constants import CHOICE_COLOR
+from .constants import CHOICE_COLOR, THUMBNAIL_SIZES
+from .images import thumbnail_name
 
 
 class Ingredient(models.Model):
@@ -9,6 +11,14 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=200)
     measurement_unit = models.CharField(max_length=200)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_measurement_unit'
+            )
+        ]
+
     def __str__(self):
         return f'{self.name}'
 
@@ -30,13 +40,30 @@ class Recipe(models.Model):
     text = models.TextField()
     tags = models.ManyToManyField(Tag)
     image = models.ImageField(upload_to='images/')
+    image_processed = models.BooleanField(default=False, editable=False)
     cooking_time = models.PositiveIntegerField()
     ingredients = models.ManyToManyField(Ingredient,
                                          through='RecipeIngredient')
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(default=0, editable=False)
+    # Заполняется триггером PostgreSQL, на других СУБД остаётся пустым.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        ordering = ('-id',)
 
     def __str__(self):
         return f'{self.name}'
 
+    @property
+    def thumbnails(self):
+        '''Имена файлов миниатюр или исходная картинка до обработки.'''
+        return {
+            size: (thumbnail_name(self.image.name, size)
+                   if self.image_processed else self.image.name)
+            for size in THUMBNAIL_SIZES
+        }
+
 
 class RecipeIngredient(models.Model):
     '''Модель для связи рецептов и ингредиентов.'''
@@ -55,6 +82,14 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(
         Recipe, related_name='favorite', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite_user_recipe'
+            )
+        ]
+
     def __str__(self):
         return str(self.recipe)
 
@@ -66,5 +101,13 @@ class ShoppingCart(models.Model):
     recipe = models.ForeignKey(
         Recipe, related_name='shopping_cart', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart_user_recipe'
+            )
+        ]
+
     def __str__(self):
         return str(self.recipe)
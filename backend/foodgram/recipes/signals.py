@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Изображение рецепта обработано и сохранено в бд, аргумент recipe_id.
+image_processed = Signal()
@@ -6,7 +6,8 @@ from .models import CustomUser, Follow
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
-    list_display = ['email', 'username', 'first_name', 'last_name', 'password']
+    list_display = ['email', 'username', 'first_name', 'last_name', 'password',
+                    'recipes_count']
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -1,3 +1,5 @@
+from api.fields import ThumbnailsField
+from api.metrics import TimedListSerializer, TimedSerializerMixin
 from recipes.models import Recipe
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
@@ -5,7 +7,16 @@ from rest_framework.validators import UniqueTogetherValidator
 from .models import CustomUser, Follow
 
 
-class UserSerializer(serializers.ModelSerializer):
+def get_recipes_limit(request):
+    '''Значение recipes_limit из запроса или None.'''
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     '''Сериализатор для пользователей.'''
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -14,8 +25,11 @@ class UserSerializer(serializers.ModelSerializer):
         fields = (
             'email', 'id', 'username',
             'first_name', 'last_name', 'is_subscribed')
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if not user.is_anonymous:
             return Follow.objects.filter(user=user,
@@ -23,7 +37,8 @@ class UserSerializer(serializers.ModelSerializer):
         return False
 
 
-class UserPostSerializer(serializers.ModelSerializer):
+class UserPostSerializer(TimedSerializerMixin,
+                         serializers.ModelSerializer):
     '''Сериализатор для добавления пользователей.'''
     class Meta:
         model = CustomUser
@@ -46,9 +61,11 @@ class UserPostSerializer(serializers.ModelSerializer):
 
 class DemoRecipeSerializer(serializers.ModelSerializer):
     '''Сериализатор для ограниеченности полей рецепта.'''
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class FollowSerializer(UserSerializer):
@@ -56,13 +73,14 @@ class FollowSerializer(UserSerializer):
     first_name = serializers.CharField(required=True)
     last_name = serializers.CharField(required=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = CustomUser
         fields = ('email', 'id', 'username',
                   'first_name', 'last_name', 'is_subscribed', 'recipes',
                   'recipes_count')
+        list_serializer_class = TimedListSerializer
         validators = [
             UniqueTogetherValidator(
                 queryset=Follow.objects.all(),
@@ -72,13 +90,11 @@ class FollowSerializer(UserSerializer):
 
     def get_recipes(self, obj):
         '''Получение рецептов'''
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.id)
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'preview_recipes'):
+            recipes = obj.preview_recipes
+        else:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = Recipe.objects.filter(author=obj.id)
+            if limit:
+                recipes = recipes[:limit]
         return DemoRecipeSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        '''Получение кол-во рецептов'''
-        return Recipe.objects.filter(author=obj).count()
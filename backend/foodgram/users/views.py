@@ -1,12 +1,15 @@
 from api.pagination import CustomApiPagination
+from django.db.models import BooleanField, OuterRef, Prefetch, Subquery, Value
 from django.shortcuts import get_object_or_404
 from djoser.serializers import SetPasswordSerializer
+from recipes.models import Recipe
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from .models import CustomUser, Follow
-from .serializers import FollowSerializer, UserPostSerializer, UserSerializer
+from .serializers import (FollowSerializer, UserPostSerializer, UserSerializer,
+                          get_recipes_limit)
 
 
 class CustomUserViewSet(viewsets.ModelViewSet):
@@ -32,7 +35,7 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         if serializer.is_valid(raise_exception=True):
             new_password = serializer.data['new_password']
             self.request.user.set_password(new_password)
-            self.request.user.save()
+            self.request.user.save(update_fields=['password'])
             return Response('Пароль успешно изменен.',
                             status=status.HTTP_204_NO_CONTENT)
         return Response(serializer._errors,
@@ -83,7 +86,18 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
         '''Метод для отображения подписок.'''
-        subscriptions = CustomUser.objects.filter(following__user=request.user)
+        recipes = Recipe.objects.all()
+        limit = get_recipes_limit(request)
+        if limit:
+            recipes = recipes.filter(id__in=Subquery(Recipe.objects.filter(
+                author=OuterRef('author')).values('id')[:limit]))
+        subscriptions = CustomUser.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch('recipe_set', queryset=recipes, to_attr='preview_recipes')
+        ).order_by('id')
         context = {'request': request}
         paginate = self.paginate_queryset(subscriptions)
         serializer = FollowSerializer(paginate, context=context, many=True)